@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import pygame
+
+from game import Game
+from scripts.profiler import AllocationProfiler, resident_memory
+
+# Scripted inputs, cycled every 120 frames: (frame, event type, key or button)
+INPUT_SCRIPT = [
+    (0, pygame.KEYDOWN, pygame.K_d),
+    (20, pygame.KEYDOWN, pygame.K_w),
+    (35, pygame.MOUSEBUTTONDOWN, 1),
+    (50, pygame.KEYDOWN, pygame.K_SPACE),
+    (60, pygame.KEYUP, pygame.K_d),
+    (60, pygame.KEYDOWN, pygame.K_a),
+    (75, pygame.KEYDOWN, pygame.K_w),
+    (90, pygame.MOUSEBUTTONDOWN, 3),
+    (105, pygame.KEYDOWN, pygame.K_RSHIFT),
+    (119, pygame.KEYUP, pygame.K_a),
+]
+SCRIPT_LENGTH = 120
+
+
+def scripted_inputs(frame, game):
+    inputs = []
+    for script_frame, e_type, code in INPUT_SCRIPT:
+        if frame % SCRIPT_LENGTH == script_frame:
+            if e_type == pygame.MOUSEBUTTONDOWN:
+                # Clicking just in front of the player
+                pos = (game.screen.get_width() // 2 + (-40 if game.player.flip else 40), game.screen.get_height() // 2)
+                inputs.append(pygame.event.Event(e_type, button=code, pos=pos))
+            else:
+                inputs.append(pygame.event.Event(e_type, key=code))
+    return inputs
+
+
+def level_ids():
+    return sorted({int(os.path.splitext(name)[0]) for name in os.listdir('data/maps')})
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(samples):
+    return {'mean': sum(samples) / len(samples), 'p95': percentile(samples, 95), 'p99': percentile(samples, 99),
+            'max': max(samples)}
+
+
+def bench_level(game, map_id, frames):
+    game.level = map_id
+    game.load_level(map_id)
+    game.movement = [False, False]
+    # Memory growth is measured from this level's own start, not from the level before it
+    if isinstance(game.profiler, AllocationProfiler):
+        game.profiler.drop_snapshot()
+
+    update_times = []
+    render_times = []
+    reloads = 0
+    for frame in range(frames):
+        for event in scripted_inputs(frame, game):
+            game.handle_event(event)
+
+        game.profiler.begin_frame()
+        start = time.perf_counter()
+        game.update()
+        mid = time.perf_counter()
+        game.render()
+        end = time.perf_counter()
+        game.profiler.end_frame()
+
+        update_times.append((mid - start) * 1000)
+        render_times.append((end - mid) * 1000)
+
+        # Clearing the level moves on to the next one, so going back to the one being measured
+        if game.level != map_id:
+            reloads += 1
+            game.level = map_id
+            game.load_level(map_id)
+            if isinstance(game.profiler, AllocationProfiler):
+                game.profiler.drop_snapshot()
+
+    total_times = [u + r for u, r in zip(update_times, render_times)]
+    return {'update_ms': summarize(update_times), 'render_ms': summarize(render_times),
+            'frame_ms': summarize(total_times), 'reloads': reloads}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures per-level frame times, split into update and render.")
+    parser.add_argument('--frames', type=int, default=600, help="frames to simulate per level")
+    parser.add_argument('--levels', type=int, nargs='*', help="level ids to measure (default: all)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_output.json', help="where to write the JSON results")
+    parser.add_argument('--profile', help="also write per-frame stage timings to this CSV or JSON file")
+    parser.add_argument('--trace-alloc', help="trace allocations per stage (slow) and write a JSON report here")
+    parser.add_argument('--alloc-budget', type=int, help="trace allocations and fail if any stage allocates more "
+                                                         "than this many bytes per frame at peak")
+    args = parser.parse_args()
+
+    game = Game(headless=True, profile_path=args.profile, seed=args.seed)
+    if args.trace_alloc or args.alloc_budget is not None:
+        game.profiler = AllocationProfiler(keep_frames=bool(args.profile), exclude=[__file__])
+
+    results = {'frames': args.frames, 'seed': args.seed, 'levels': {}}
+    for map_id in (args.levels if args.levels else level_ids()):
+        stats = bench_level(game, map_id, args.frames)
+        results['levels'][str(map_id)] = stats
+        print(f"Level {map_id:>2}: frame {stats['frame_ms']['mean']:.3f}ms "
+              f"(p95 {stats['frame_ms']['p95']:.3f}, p99 {stats['frame_ms']['p99']:.3f}) "
+              f"update {stats['update_ms']['mean']:.3f}ms render {stats['render_ms']['mean']:.3f}ms")
+
+    f = open(args.output, 'w')
+    json.dump(results, f, indent=2)
+    f.close()
+    print(f"Saved results to {args.output}")
+    if args.profile:
+        game.profiler.export(args.profile)
+        print(f"Saved stage timings to {args.profile}")
+    if args.trace_alloc:
+        print(game.profiler.report())
+        memory = resident_memory(game)
+        print('Resident memory: ' + ', '.join(f"{name} {size / 1024:.0f}KB" for name, size in memory.items()))
+        f = open(args.trace_alloc, 'w')
+        json.dump({'stages': game.profiler.stage_allocations(), 'growth': game.profiler.growth,
+                   'memory': memory}, f, indent=2)
+        f.close()
+        print(f"Saved allocation report to {args.trace_alloc}")
+
+    over_budget = []
+    if args.alloc_budget is not None:
+        over_budget = game.profiler.over_budget(args.alloc_budget)
+        allocations = game.profiler.stage_allocations()
+        for name in over_budget:
+            print(f"Over the allocation budget of {args.alloc_budget} bytes: {name} ({allocations[name][0]:.0f} bytes)")
+        if not over_budget:
+            print(f"Every stage is within the allocation budget of {args.alloc_budget} bytes")
+
+    pygame.quit()
+    sys.exit(1 if over_budget else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,8 @@ from tkinter import filedialog
 
 from scripts.utils import load_images, load_spritesheet
 from scripts.tilemap import Tilemap
+from scripts.journal import EditJournal
+from scripts.presenter import Presenter
 
 RENDER_SCALE = 4.0  # USED TO BE 2.0
 
@@ -15,6 +17,9 @@ class Editor:
     def __init__(self):
         self.tilemap = Tilemap(self, tile_size=16)
 
+        # Undo / redo history, one entry per mouse stroke or autotile
+        self.journal = EditJournal()
+
         self.file, contin = self.get_file()
         print(f"Opened file: {self.file}")
 
@@ -23,8 +28,9 @@ class Editor:
         pygame.init()
 
         pygame.display.set_caption("editor")
-        self.screen = pygame.display.set_mode((1280, 960))
+        self.screen = pygame.display.set_mode((int(320 * RENDER_SCALE), int(240 * RENDER_SCALE)))
         self.display = pygame.Surface((320, 240))
+        self.presenter = Presenter(self.screen, self.display.get_size(), RENDER_SCALE)
 
         self.clock = pygame.time.Clock()
 
@@ -70,7 +76,7 @@ class Editor:
 
     def get_file(self):
         file = filedialog.asksaveasfilename(initialdir='data/maps',
-                                            title="Select JSON Map", confirmoverwrite=False)
+                                            title="Select Map (.json or .map)", confirmoverwrite=False)
         print(f"Opening {file}")
         try:
             if os.path.exists(file):
@@ -81,9 +87,13 @@ class Editor:
         except KeyError:
             return file, True
         try:
-            f = open(file, 'w')
-            f.write('{\n\n}')
-            f.close()
+            if file.endswith('.map'):
+                # Binary maps have no empty form to write by hand, so an empty map is saved instead
+                self.tilemap.save(file)
+            else:
+                f = open(file, 'w')
+                f.write('{\n\n}')
+                f.close()
             print(f"Creating {file}")
             return file, True
         except TypeError or FileNotFoundError:
@@ -97,7 +107,7 @@ class Editor:
             self.scroll[1] += (self.movement[3] - self.movement[2]) * 2
             render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
 
-            self.tilemap.render(self.display, offset=render_scroll, optimize_offgrid=False, spawners=True)
+            self.tilemap.render(self.display, offset=render_scroll, spawners=True)
 
             current_tile_image = self.assets[self.tile_list[self.tile_group]][self.tile_variant].copy()
             current_tile_image.set_alpha(100)
@@ -114,18 +124,20 @@ class Editor:
                 self.display.blit(current_tile_image, mpos)
 
             if self.clicking and self.ongrid:
-                self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = \
-                    {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant, 'pos': tile_pos}
+                before = self.tilemap.tilemap.get(tile_pos)
+                self.tilemap.set_tile(tile_pos, self.tile_list[self.tile_group], self.tile_variant)
+                self.journal.record_tile(tile_pos, before, self.tilemap.tilemap.get(tile_pos))
             if self.right_clicking:
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-                for tile in self.tilemap.offgrid_tiles.copy():
+                before = self.tilemap.tilemap.get(tile_pos)
+                self.tilemap.remove_tile(tile_pos)
+                self.journal.record_tile(tile_pos, before, None)
+                for tile in self.tilemap.offgrid_around((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
                     tile_img = self.assets[tile['type']][tile['variant']]
                     tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0], tile['pos'][1] - self.scroll[1],
                                          tile_img.get_width(), tile_img.get_height())
                     if tile_r.collidepoint(mpos):
-                        self.tilemap.offgrid_tiles.remove(tile)
+                        self.tilemap.remove_offgrid(tile)
+                        self.journal.record_offgrid(tile, added=False)
 
             self.display.blit(current_tile_image, (5, 5))
 
@@ -138,11 +150,10 @@ class Editor:
                     if event.button == 1:
                         self.clicking = True
                         if not self.ongrid:
-                            self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group],
-                                                               'variant': self.tile_variant, 'pos': (mpos[0]
-                                                                                                     + self.scroll[0],
-                                                                                                     mpos[1] +
-                                                                                                     self.scroll[1])})
+                            tile = {'type': self.tile_list[self.tile_group], 'variant': self.tile_variant,
+                                    'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])}
+                            self.tilemap.add_offgrid(tile)
+                            self.journal.record_offgrid(tile, added=True)
                     if event.button == 3:
                         self.right_clicking = True
                     if self.shift:
@@ -165,6 +176,8 @@ class Editor:
                         self.clicking = False
                     if event.button == 3:
                         self.right_clicking = False
+                    if not self.clicking and not self.right_clicking:
+                        self.journal.end()
 
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_a:
@@ -181,11 +194,22 @@ class Editor:
                         self.tilemap.save(self.file)
                         print(f"Saving {self.file}")
                     if event.key == pygame.K_t:
-                        self.tilemap.autotile()
+                        self.journal.end()
+                        for pos, before, after in self.tilemap.autotile():
+                            self.journal.record_tile(pos, before, after)
+                        self.journal.end()
+                    if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                        if event.mod & pygame.KMOD_SHIFT:
+                            self.journal.redo(self.tilemap)
+                        else:
+                            self.journal.undo(self.tilemap)
+                    if event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                        self.journal.redo(self.tilemap)
                     if event.key == pygame.K_LSHIFT:
                         self.shift = True
                     if event.key == pygame.K_c:
                         self.tilemap = Tilemap(self, tile_size=16)
+                        self.journal.clear()
                         self.file, null = self.get_file()
 
                     if event.key == pygame.K_n:
@@ -204,8 +228,7 @@ class Editor:
                     if event.key == pygame.K_LSHIFT:
                         self.shift = False
 
-            self.screen.blit(pygame.transform.scale(self.display, self.screen.get_size()), (0, 0))
-            pygame.display.update()
+            self.presenter.present(self.display)
             self.clock.tick(60)
 
 
@@ -1,75 +1,97 @@
 import os
 import sys
-import math
 import random
+import argparse
 
 import pygame
 
-from scripts.effects.spark import Spark
+from scripts.effects.spark import Sparks
 from scripts.tilemap import Tilemap
-from scripts.utils import load_images, load_spritesheet, Animation
+from scripts.utils import load_image, load_images, load_spritesheet, Animation
+from scripts.assets import Assets, ASSET_BUDGET
 from scripts.effects.clouds import Clouds
-from scripts.effects.particle import Particle
+from scripts.effects.particle import Particles
+from scripts.effects.outline import bake_outline
+from scripts.effects.transition import iris
 from scripts.entities.player import Player
 from scripts.entities.enemy import Enemy
+from scripts.entities.projectile import Projectiles
+from scripts.spatial import SpatialHash
+from scripts.mapfile import map_path, map_count
+from scripts.prefetch import LevelPrefetcher
+from scripts.presenter import Presenter
+from scripts.profiler import Profiler
+from scripts.replay import InputRecorder, Replay
+
+ENEMY_COLORS = ['red', 'orange', 'yellow', 'green', 'blue', 'purple']
 
 
 class Game:
-    def __init__(self):
+    def __init__(self, headless=False, asset_budget=ASSET_BUDGET, screen_scale=4, profile_path=None, seed=None,
+                 record_path=None):
+        # Headless mode uses dummy drivers, so it can run with no display or sound card
+        self.headless = headless
+        if self.headless:
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+
         pygame.init()
 
-        self.screen_scale = 4
+        self.screen_scale = screen_scale
 
         pygame.display.set_caption("Samurai Game")
         self.screen = pygame.display.set_mode((320 * self.screen_scale, 240 * self.screen_scale))
         self.display = pygame.Surface((320, 240), pygame.SRCALPHA)
         self.display_2 = pygame.Surface((320, 240))
+        self.spark_layer = pygame.Surface((320, 240), pygame.SRCALPHA)
+        self.presenter = Presenter(self.screen, self.display_2.get_size(), self.screen_scale)
 
         self.clock = pygame.time.Clock()
 
-        self.assets = {
-            'backgrounds': load_images('backgrounds'),  # Background Image
-            'grass': load_images('tiles/grass'),  # Tile Images
-            'stone': load_images('tiles/stone'),
-            'large_decor': load_images('tiles/large_decor'),
-            'decor': load_images('tiles/decor'),
-            'clouds': load_images('clouds'),  # Clouds
-            'player/idle': Animation(load_spritesheet('entities/player/idle.png', (13, 17), (18, 18), 22), img_dur=6),
-            # Player Images
-            'player/run': Animation(load_spritesheet('entities/player/run.png', (13, 17), (18, 18), 8), img_dur=3),
-            'player/jump': Animation(load_spritesheet('entities/player/jump.png', (13, 17), (18, 18), 1)),
-            'player/slide': Animation(load_spritesheet('entities/player/slide.png', (13, 17), (18, 18), 1)),
-            'player/wall_slide': Animation(load_spritesheet('entities/player/wall_slide.png', (13, 17), (18, 18), 1)),
-            'particle/leaf': Animation(load_images('particles/leaf'), img_dur=20, loop=False),  # Particles
-            'particle/particle': Animation(load_images('particles/particle'), img_dur=6, loop=False),
-            'enemy/bow': load_spritesheet('entities/enemies/bow.png', (6, 10), (10, 10), 1),
-            'enemy/arrow': [
-                pygame.transform.scale(load_spritesheet('entities/enemies/bow.png', (7, 1), (7, 7), 1)[0], [19, 2])],
-            'enemy/red/idle': Animation(load_spritesheet('entities/enemies/red/idle.png', (13, 17), (18, 18), 16),
-                                        img_dur=6),
-            'enemy/red/run': Animation(load_spritesheet('entities/enemies/red/run.png', (13, 17), (18, 18), 7),
-                                       img_dur=4),
-            'enemy/orange/idle': Animation(load_spritesheet('entities/enemies/orange/idle.png', (13, 17), (18, 18), 16),
-                                           img_dur=6),
-            'enemy/orange/run': Animation(load_spritesheet('entities/enemies/orange/run.png', (13, 17), (18, 18), 7),
-                                          img_dur=4),
-            'enemy/yellow/idle': Animation(load_spritesheet('entities/enemies/yellow/idle.png', (13, 17), (18, 18), 16),
-                                           img_dur=6),
-            'enemy/yellow/run': Animation(load_spritesheet('entities/enemies/yellow/run.png', (13, 17), (18, 18), 7),
-                                          img_dur=4),
-            'enemy/green/idle': Animation(load_spritesheet('entities/enemies/green/idle.png', (13, 17), (18, 18), 16),
-                                          img_dur=6),
-            'enemy/green/run': Animation(load_spritesheet('entities/enemies/green/run.png', (13, 17), (18, 18), 7),
-                                         img_dur=4),
-            'enemy/blue/idle': Animation(load_spritesheet('entities/enemies/blue/idle.png', (13, 17), (18, 18), 16),
-                                         img_dur=6),
-            'enemy/blue/run': Animation(load_spritesheet('entities/enemies/blue/run.png', (13, 17), (18, 18), 7),
-                                        img_dur=4),
-            'enemy/purple/idle': Animation(load_spritesheet('entities/enemies/purple/idle.png', (13, 17), (18, 18), 16),
-                                           img_dur=6),
-            'enemy/purple/run': Animation(load_spritesheet('entities/enemies/purple/run.png', (13, 17), (18, 18), 7),
-                                          img_dur=4),
-        }
+        # Everything random goes through these, so the same seed and inputs always play out the same way.
+        # Screenshake and clouds use their own, so rendering or not never changes what happens in the game
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.random = random.Random(self.seed)
+        self.render_random = random.Random(self.seed ^ 0x5EED)
+
+        # Inputs and per-frame state hashes, written to record_path on quit if one is given
+        self.recorder = InputRecorder(record_path, self.seed) if record_path else None
+
+        # Per-stage frame timings, shown with F3 and written to profile_path on quit if one is given
+        self.profile_path = profile_path
+        self.profiler = Profiler(enabled=bool(profile_path), keep_frames=bool(profile_path))
+
+        self.assets = Assets(budget=asset_budget)
+        for group in ['grass', 'stone', 'large_decor', 'decor']:  # Tile Images
+            self.assets.register(group, lambda group=group: load_images('tiles/' + group))
+        self.assets.register('clouds', lambda: load_images('clouds'))  # Clouds
+        # Player Images
+        self.assets.register('player/idle', lambda: Animation(
+            load_spritesheet('entities/player/idle.png', (13, 17), (18, 18), 22), img_dur=6))
+        self.assets.register('player/run', lambda: Animation(
+            load_spritesheet('entities/player/run.png', (13, 17), (18, 18), 8), img_dur=3))
+        for action in ['jump', 'slide', 'wall_slide']:
+            self.assets.register('player/' + action, lambda action=action: Animation(
+                load_spritesheet('entities/player/' + action + '.png', (13, 17), (18, 18), 1)))
+        # Particles
+        self.assets.register('particle/leaf', lambda: Animation(load_images('particles/leaf'), img_dur=20, loop=False))
+        self.assets.register('particle/particle', lambda: Animation(load_images('particles/particle'), img_dur=6,
+                                                                    loop=False))
+        self.assets.register('enemy/bow', lambda: load_spritesheet('entities/enemies/bow.png', (6, 10), (10, 10), 1))
+        self.assets.register('enemy/arrow', lambda: [
+            pygame.transform.scale(load_spritesheet('entities/enemies/bow.png', (7, 1), (7, 7), 1)[0], [19, 2])])
+
+        # Backgrounds and enemy colors are only loaded once a level uses them, and can be evicted again
+        for i, name in enumerate(sorted(os.listdir('data/images/backgrounds'))):
+            self.assets.register('backgrounds/' + str(i), lambda name=name: load_image('backgrounds/' + name),
+                                 resident=False)  # Background Images
+        for color in ENEMY_COLORS:
+            self.assets.register('enemy/' + color + '/idle', lambda color=color: Animation(
+                load_spritesheet('entities/enemies/' + color + '/idle.png', (13, 17), (18, 18), 16), img_dur=6),
+                resident=False)
+            self.assets.register('enemy/' + color + '/run', lambda color=color: Animation(
+                load_spritesheet('entities/enemies/' + color + '/run.png', (13, 17), (18, 18), 7), img_dur=4),
+                resident=False)
 
         # Getting sound effects and setting volume
         self.sfx = {
@@ -96,19 +118,28 @@ class Game:
 
         # Setting Up Enemies & Projectiles
         self.enemies = []
-        self.projectiles = []
+        self.projectiles = Projectiles(self)
+
+        # Enemies bucketed by position, so only the ones near the player are looked at
+        self.enemy_grid = SpatialHash(cell_size=128)
 
         # Tile map Data
         self.tilemap = Tilemap(self, tile_size=16)
 
-        # Getting Current Level
+        # Getting Current Level, and how many there are
         self.level = 0
+        self.level_count = map_count('data/maps')
+
+        # The next level is read on a worker thread while the current one finishes, starting once the last enemy
+        # is gone. Its path is only looked up then, not on every frame of the transition
+        self.prefetcher = LevelPrefetcher()
+        self.next_level_path = None
 
         # Current Background
-        self.background = self.assets['backgrounds'][0]
+        self.background = None
 
         # Clouds
-        self.clouds = Clouds(self.assets['clouds'], count=16)
+        self.clouds = Clouds(self.assets['clouds'], count=16, rng=self.render_random)
 
         # Camera Scroll
         self.scroll = [0, 0]
@@ -117,21 +148,29 @@ class Game:
         self.screenshake = 0
 
         # Particles and Sparks
-        self.particles = []
-        self.sparks = []
+        self.particles = Particles(self)
+        self.sparks = Sparks()
 
         self.leaf_spawners = []
 
         self.transition = -30
 
+        # The state each level starts in, taken by load_level
+        self.level_snapshot = None
+
         # Loading Level
         self.load_level(self.level)
 
     def load_level(self, map_id):
-        self.tilemap.load('data/maps/' + str(map_id) + '.json')
+        path = map_path('data/maps', map_id)
+        level = self.prefetcher.take(path)
+        if level:
+            self.tilemap.set_level(level)
+        else:
+            self.tilemap.load(path)
 
         # Setting Background
-        self.background = self.assets['backgrounds'][self.tilemap.background]
+        self.background = self.assets['backgrounds/' + str(self.tilemap.background)]
 
         # Tree Leaves
         self.leaf_spawners.clear()
@@ -149,15 +188,50 @@ class Game:
                 self.player.air_time = 0
             else:
                 self.enemies.append(Enemy(self,
-                                          random.choice(['red', 'orange', 'yellow', 'green', 'blue', 'purple'])
-                                          if spawner['variant'] == 1
-                                          else ['red', 'orange', 'yellow', 'green', 'blue', 'purple'][spawner['variant']
-                                                                                                      - 2],
+                                          self.random.choice(ENEMY_COLORS) if spawner['variant'] == 1
+                                          else ENEMY_COLORS[spawner['variant'] - 2],
                                           spawner['pos'], (8, 15)))
-                self.enemies[-1].flip = random.randint(0, 1) == 1
+                self.enemies[-1].flip = self.random.randint(0, 1) == 1
+
+        # Keeping this level's background and enemy colors loaded, and letting the rest go if over budget
+        level_assets = {'backgrounds/' + str(self.tilemap.background)}
+        for enemy in self.enemies:
+            level_assets.update({enemy.type + '/idle', enemy.type + '/run'})
+        self.assets.use(level_assets)
+
+        # Remembering the level as it starts, so retrying it doesn't have to load it again
+        self.level_snapshot = {
+            'level': map_id,
+            'tilemap': self.tilemap.snapshot(),
+            'leaf_spawners': self.leaf_spawners.copy(),
+            'player_pos': list(self.player.pos),
+            'enemies': [(enemy.color, list(enemy.pos), enemy.flip) for enemy in self.enemies],
+        }
+
+        self.start_level()
+
+    def restore_level(self):
+        # Putting the level back the way load_level left it, with the same enemies as the first try
+        snapshot = self.level_snapshot
+        self.tilemap.restore(snapshot['tilemap'])
+        self.leaf_spawners = snapshot['leaf_spawners'].copy()
+        self.player.pos = list(snapshot['player_pos'])
+
+        self.enemies.clear()
+        self.projectiles.clear()
+        for color, pos, flip in snapshot['enemies']:
+            self.enemies.append(Enemy(self, color, pos, (8, 15)))
+            self.enemies[-1].flip = flip
+
+        self.start_level()
+
+    def start_level(self):
+        self.enemy_grid.clear()
+        for enemy in self.enemies:
+            self.enemy_grid.insert(enemy, enemy.pos)
 
-        self.particles = []
-        self.sparks = []
+        self.particles.clear()
+        self.sparks.clear()
 
         self.player.reset()
 
@@ -171,6 +245,8 @@ class Game:
 
         self.dead = 0
 
+        self.next_level_path = None
+
     def run(self):
         pygame.mixer.music.load('data/sfx/music.wav')
         pygame.mixer.music.set_volume(0.7)
@@ -179,173 +255,238 @@ class Game:
         self.sfx['ambience'].play(-1)
 
         while True:
-            self.display.fill((0, 0, 0, 0))
-            self.display_2.blit(self.background, (0, 0))
-
-            # Getting Camera Scroll
-            self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 20
-            self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 27
-            render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
-
-            # Updating Screen shake
-            self.screenshake = max(0, self.screenshake - 1)
-
-            if self.dead:
-                self.dead += 1
-                if self.dead >= 10:
-                    self.transition = min(self.transition + 1, 30)
-                if self.dead > 40:
-                    self.load_level(self.level)
+            self.step(pygame.event.get())
+            self.clock.tick(60)
 
-            if not len(self.enemies):
-                self.transition += 1
-                if self.transition > 30:
-                    self.level = min(self.level + 1, len(os.listdir('data/maps')) - 1)
+    def step(self, inputs=(), render=True):
+        # Advancing exactly one tick, without waiting on the clock
+        self.profiler.begin_frame()
+        for event in inputs:
+            self.handle_event(event)
+        self.profiler.mark('events')
+
+        self.update()
+
+        if render:
+            self.render()
+        self.profiler.end_frame()
+
+        if self.recorder:
+            self.recorder.record(inputs, self)
+
+    def update(self):
+        # Line of sight results are only reused within a frame
+        self.tilemap.clear_sight_cache()
+
+        # Getting Camera Scroll
+        self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 20
+        self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 27
+
+        # Updating Screen shake
+        self.screenshake = max(0, self.screenshake - 1)
+
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(self.transition + 1, 30)
+            if self.dead > 40:
+                if self.level_snapshot and self.level_snapshot['level'] == self.level:
+                    self.restore_level()
+                else:
                     self.load_level(self.level)
-            if self.transition < 0:
-                self.transition += 1
-
-            # Updating Background clouds
-            self.clouds.update()
-            self.clouds.render(self.display_2, render_scroll)
-
-            # Updating and Rendering Tile map
-            self.tilemap.render(self.display, offset=render_scroll, optimize_offgrid=True, spawners=False)
-
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1]
-                projectile[2] += 1
-                img = self.assets['enemy/arrow'][0]
-                self.display.blit(img, (projectile[0][0] - img.get_width() / 2 - render_scroll[0],
-                                        projectile[0][1] - img.get_height() / 2 - render_scroll[1]))
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
-                    for i in range(4):
-                        self.sparks.append(
-                            Spark(projectile[0], random.random() - 0.5 + (math.pi if projectile[1] > 0 else 0),
-                                  2 + random.random()))
-                elif projectile[2] > 360:
-                    self.projectiles.remove(projectile)
-                elif abs(self.player.dashing) < 50:
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        self.sfx['hit'].play()
-                        self.dead += 1
-                        self.screenshake = max(35, self.screenshake + 35)
-                        for i in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random() * 5
-                            self.sparks.append(Spark(self.player.rect().center, angle, 2 + random.random()))
-                            self.particles.append(Particle(self, 'particle', self.player.rect().center,
-                                                           velocity=[math.cos(angle + math.pi) * speed * 0.5,
-                                                                     math.sin(angle + math.pi) * speed * 0.5],
-                                                           frame=random.randint(0, 7)))
-
-            # Updating and Rendering Enemies
-            for enemy in self.enemies.copy():
-                if ((self.player.pos[0] - enemy.pos[0]) ** 2 + (self.player.pos[1] - enemy.pos[1]) ** 2) ** 0.5 <= 310:
-                    kill = enemy.update(self.tilemap, (0, 0))
-                    enemy.render(self.display, offset=render_scroll)
-                    if kill:
-                        self.enemies.remove(enemy)
-
-            # Updating & Rendering player
-            if not self.dead:
-                self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
-                self.player.render(self.display, offset=render_scroll)
-
-            # Updating Leaves from trees
-            for rect in self.leaf_spawners:
-                if random.random() * 49999 < rect.width * rect.height:
-                    pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
-                    self.particles.append(Particle(self, 'leaf', pos,
-                                                   velocity=[-0.1, 0.3], frame=random.randint(0, 20)))
-
-            # Updating and Rendering Particles / Sparks
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, offset=render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            display_mask = pygame.mask.from_surface(self.display)
-            display_sillhoette = display_mask.to_surface(setcolor=(0, 0, 0, 180), unsetcolor=(0, 0, 0, 0))
-            for pos in [(-1, 0), (1, 0), (0, -1), (0, 1)]:
-                self.display_2.blit(display_sillhoette, pos)
-
-            for particle in self.particles.copy():
-                if ((self.player.pos[0] - particle.pos[0]) ** 2 + (self.player.pos[1] - particle.pos[1]) ** 2) ** 0.5 <= 310:
-                    kill = particle.update()
-                    particle.render(self.display, offset=render_scroll)
-                    if particle.type == 'leaf':
-                        particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3
-                    if kill:
-                        self.particles.remove(particle)
-
-            for event in pygame.event.get():
-                # Quiting game if window is closed
-                if event.type == pygame.QUIT:
-                    pygame.quit()
-                    sys.exit()
-
-                # Getting Key Down Presses
-                if event.type == pygame.KEYDOWN:
-                    if event.key == pygame.K_a:
-                        self.movement[0] = True
-                    if event.key == pygame.K_d:
-                        self.movement[1] = True
-                    if event.key == pygame.K_w:
-                        if self.player.jump():
-                            self.sfx['jump'].play()
-                    if event.key == pygame.K_SPACE or event.key == pygame.K_LSHIFT:
-                        self.player.dash()
-                    if event.key == pygame.K_RSHIFT:
-                        if self.player.flip:
-                            self.player.slash(self.tilemap, (self.player.rect().center[0] - 15,
-                                                             self.player.rect().center[1] + 3))
-                        else:
-                            self.player.slash(self.tilemap, (self.player.rect().center[0] + 15,
-                                                             self.player.rect().center[1] + 3))
-                    if event.key == pygame.K_SLASH:
-                        if self.player.flip:
-                            self.player.stab(self.tilemap, (self.player.rect().center[0] - 15,
-                                                            self.player.rect().center[1] + 3))
-                        else:
-                            self.player.stab(self.tilemap, (self.player.rect().center[0] + 15,
-                                                            self.player.rect().center[1] + 3))
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    if event.button == 1:
-                        mouse_to_player = ((pygame.mouse.get_pos()[0] / self.screen_scale) + self.scroll[0],
-                                           (pygame.mouse.get_pos()[1] / self.screen_scale) + self.scroll[1])
-                        self.player.slash(self.tilemap, mouse_to_player)
-                    if event.button == 3:
-                        mouse_to_player = ((pygame.mouse.get_pos()[0] / self.screen_scale) + self.scroll[0],
-                                           (pygame.mouse.get_pos()[1] / self.screen_scale) + self.scroll[1])
-                        self.player.stab(self.tilemap, mouse_to_player)
-
-                if event.type == pygame.KEYUP:
-                    if event.key == pygame.K_a:
-                        self.movement[0] = False
-                    if event.key == pygame.K_d:
-                        self.movement[1] = False
-
-            if self.transition:
-                transition_surf = pygame.Surface(self.display.get_size())
-                pygame.draw.circle(transition_surf, (255, 255, 255),
-                                   (self.display.get_width() // 2, self.display.get_height() // 2),
-                                   (30 - abs(self.transition)) * 8)
-                transition_surf.set_colorkey((255, 255, 255))
-                self.display.blit(transition_surf, (0, 0))
-
-            # Bliting images and displaying screenshake
-            self.display_2.blit(self.display, (0, 0))
 
-            screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2,
-                                  random.random() * self.screenshake - self.screenshake / 2)
-            self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()), screenshake_offset)
-            pygame.display.update()
-            self.clock.tick(60)
+        if not len(self.enemies):
+            # Starting on the next level as soon as the last enemy is gone
+            if not self.next_level_path:
+                self.next_level_path = map_path('data/maps', min(self.level + 1, self.level_count - 1))
+                self.prefetcher.prefetch(self.next_level_path)
+            self.transition += 1
+            if self.transition > 30:
+                self.level = min(self.level + 1, self.level_count - 1)
+                self.load_level(self.level)
+        if self.transition < 0:
+            self.transition += 1
+
+        self.profiler.mark('update/level')
+
+        # Updating Background clouds
+        self.clouds.update()
+        self.profiler.mark('update/clouds')
+
+        # Updating Projectiles
+        self.projectiles.update()
+        self.profiler.mark('update/projectiles')
+
+        # Updating Enemies
+        for enemy in self.enemy_grid.query_radius(self.player.pos, 310):
+            kill = enemy.update(self.tilemap, (0, 0))
+            if kill:
+                self.enemies.remove(enemy)
+                self.enemy_grid.remove(enemy)
+            else:
+                self.enemy_grid.move(enemy, enemy.pos)
+        self.profiler.mark('update/enemies')
+
+        # Updating player
+        if not self.dead:
+            self.player.update(self.tilemap, (self.movement[1] - self.movement[0], 0))
+        self.profiler.mark('update/player')
+
+        # Updating Leaves from trees
+        for rect in self.leaf_spawners:
+            if self.random.random() * 49999 < rect.width * rect.height:
+                pos = (rect.x + self.random.random() * rect.width, rect.y + self.random.random() * rect.height)
+                self.particles.spawn('leaf', pos, velocity=[-0.1, 0.3], frame=self.random.randint(0, 20))
+        self.profiler.mark('update/leaves')
+
+        # Updating Particles / Sparks
+        self.sparks.update()
+        self.profiler.mark('update/sparks')
+
+        self.particles.update()
+        self.profiler.mark('update/particles')
+
+    def render(self):
+        self.display.fill((0, 0, 0, 0))
+        self.display_2.blit(self.background, (0, 0))
+
+        render_scroll = (int(self.scroll[0]), int(self.scroll[1]))
+
+        # Rendering Background clouds
+        self.clouds.render(self.display_2, render_scroll)
+        self.profiler.mark('render/background')
+
+        # Rendering Tile map, everything up to the sparks draws its pre-baked outline onto the background
+        self.tilemap.render(self.display, offset=render_scroll, spawners=False, outline_surf=self.display_2)
+        self.profiler.mark('render/tiles')
+
+        self.projectiles.render(self.display, offset=render_scroll, outline_surf=self.display_2)
+        self.profiler.mark('render/projectiles')
+
+        # Rendering Enemies
+        for enemy in self.enemy_grid.query_radius(self.player.pos, 310):
+            enemy.render(self.display, offset=render_scroll, outline_surf=self.display_2)
+        self.profiler.mark('render/enemies')
+
+        # Rendering player
+        if not self.dead:
+            self.player.render(self.display, offset=render_scroll, outline_surf=self.display_2)
+        self.profiler.mark('render/player')
+
+        # Rendering Particles / Sparks, with sparks outlined over just the area they cover
+        spark_area = self.sparks.render(self.spark_layer, offset=render_scroll)
+        if spark_area:
+            spark_area = spark_area.clip(self.spark_layer.get_rect())
+        if spark_area:
+            sparks = self.spark_layer.subsurface(spark_area)
+            self.display_2.blit(bake_outline(sparks), (spark_area.x - 1, spark_area.y - 1))
+            self.display.blit(sparks, spark_area.topleft)
+            self.spark_layer.fill((0, 0, 0, 0), spark_area)
+        self.profiler.mark('render/sparks')
+
+        self.particles.render(self.display, offset=render_scroll)
+        self.profiler.mark('render/particles')
+
+        if self.transition:
+            transition_surf = iris(self.display.get_size(), (30 - abs(self.transition)) * 8)
+            if transition_surf:
+                self.display.blit(transition_surf, (0, 0))
+        self.profiler.mark('render/transition')
+
+        # Bliting images and displaying screenshake
+        self.display_2.blit(self.display, (0, 0))
+        self.profiler.render(self.display_2)
+
+        screenshake_offset = (self.render_random.random() * self.screenshake - self.screenshake / 2,
+                              self.render_random.random() * self.screenshake - self.screenshake / 2)
+        self.presenter.present(self.display_2, screenshake_offset)
+        self.profiler.mark('render/present')
+
+    def handle_event(self, event):
+        # Quiting game if window is closed
+        if event.type == pygame.QUIT:
+            if self.profile_path:
+                self.profiler.export(self.profile_path)
+            if self.recorder:
+                self.recorder.save()
+            pygame.quit()
+            sys.exit()
+
+        # Getting Key Down Presses
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_F3:
+                self.profiler.toggle_overlay()
+            if event.key == pygame.K_a:
+                self.movement[0] = True
+            if event.key == pygame.K_d:
+                self.movement[1] = True
+            if event.key == pygame.K_w:
+                if self.player.jump():
+                    self.sfx['jump'].play()
+            if event.key == pygame.K_SPACE or event.key == pygame.K_LSHIFT:
+                self.player.dash()
+            if event.key == pygame.K_RSHIFT:
+                if self.player.flip:
+                    self.player.slash(self.tilemap, (self.player.rect().center[0] - 15,
+                                                     self.player.rect().center[1] + 3))
+                else:
+                    self.player.slash(self.tilemap, (self.player.rect().center[0] + 15,
+                                                     self.player.rect().center[1] + 3))
+            if event.key == pygame.K_SLASH:
+                if self.player.flip:
+                    self.player.stab(self.tilemap, (self.player.rect().center[0] - 15,
+                                                    self.player.rect().center[1] + 3))
+                else:
+                    self.player.stab(self.tilemap, (self.player.rect().center[0] + 15,
+                                                    self.player.rect().center[1] + 3))
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            # Using the position stored on the event, so synthetic clicks work without a real mouse
+            mouse_to_player = ((event.pos[0] / self.screen_scale) + self.scroll[0],
+                               (event.pos[1] / self.screen_scale) + self.scroll[1])
+            if event.button == 1:
+                self.player.slash(self.tilemap, mouse_to_player)
+            if event.button == 3:
+                self.player.stab(self.tilemap, mouse_to_player)
+
+        if event.type == pygame.KEYUP:
+            if event.key == pygame.K_a:
+                self.movement[0] = False
+            if event.key == pygame.K_d:
+                self.movement[1] = False
+
+
+def seed_arg(value):
+    # Seeds have to fit in a replay's header
+    seed = int(value)
+    if not 0 <= seed < 2 ** 64:
+        raise argparse.ArgumentTypeError("seed must be from 0 to 2 ** 64 - 1")
+    return seed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play Ninja Slash.")
+    parser.add_argument('--seed', type=seed_arg, default=None, help="Seed for everything random (default: a new one)")
+    parser.add_argument('--profile', default=None, help="Write per-frame stage timings here on quit (.csv or .json)")
+    parser.add_argument('--record', default=None, help="Record inputs and state hashes to this file on quit")
+    parser.add_argument('--replay', default=None, help="Play back a recording headlessly and check it still matches")
+    parser.add_argument('--render', action='store_true', help="Render each frame while replaying")
+    args = parser.parse_args()
+
+    if args.replay:
+        replay = Replay(args.replay)
+        game = Game(headless=True, seed=replay.seed, profile_path=args.profile)
+        mismatch = replay.play(game, render=args.render)
+        if args.profile:
+            game.profiler.export(args.profile)
+        if mismatch is None:
+            print('Replayed ' + str(replay.frames) + ' frames, every one matched the recording')
+        else:
+            print('Replay went differently from the recording at frame ' + str(mismatch))
+            sys.exit(1)
+        return
+
+    Game(profile_path=args.profile, seed=args.seed, record_path=args.record).run()
 
 
 if __name__ == "__main__":
-    Game().run()
+    main()
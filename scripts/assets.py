@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+from scripts.utils import Animation, uncache
+from scripts.effects.outline import uncache_outline
+
+# Roughly how many bytes of level-specific images can stay loaded once a level no longer needs them
+ASSET_BUDGET = 2 * 1024 * 1024
+
+
+def asset_images(asset):
+    if isinstance(asset, Animation):
+        return asset.images
+    if isinstance(asset, list):
+        return asset
+    return [asset]
+
+
+def asset_size(asset):
+    # Four bytes a pixel, which is what the display format uses
+    return sum(img.get_width() * img.get_height() * 4 for img in asset_images(asset))
+
+
+class Assets:
+    def __init__(self, budget=ASSET_BUDGET):
+        self.budget = budget
+
+        # Key -> (loader, kept loaded for good)
+        self.loaders = {}
+
+        # Key -> loaded asset, least recently used first
+        self.loaded = OrderedDict()
+        self.sizes = {}
+
+        # Keys the current level asked for, which are never evicted
+        self.in_use = set()
+
+    def register(self, key, loader, resident=True):
+        self.loaders[key] = (loader, resident)
+
+    def __contains__(self, key):
+        return key in self.loaders
+
+    def __getitem__(self, key):
+        if key not in self.loaded:
+            self.loaded[key] = self.loaders[key][0]()
+            self.sizes[key] = asset_size(self.loaded[key])
+        self.loaded.move_to_end(key)
+        return self.loaded[key]
+
+    def level_size(self):
+        return sum(self.sizes[key] for key in self.loaded if not self.loaders[key][1])
+
+    def use(self, keys):
+        # Loading what a level needs up front, then dropping other level assets until back under budget
+        self.in_use = set(keys)
+        for key in keys:
+            self[key]
+        self.evict()
+
+    def evict(self):
+        for key in list(self.loaded):
+            if self.level_size() <= self.budget:
+                break
+            if not self.loaders[key][1] and key not in self.in_use:
+                self.unload(key)
+
+    def unload(self, key):
+        for img in asset_images(self.loaded.pop(key)):
+            uncache_outline(img)
+            uncache(img)
+        del self.sizes[key]
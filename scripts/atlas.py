@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import zlib
+from weakref import WeakValueDictionary
+
+import pygame
+
+IMAGES_PATH = 'data/images/'
+CACHE_PATH = 'data/cache/'
+INDEX_FILE = 'atlas.json'
+PAGES_FILE = 'atlas.bin'
+ATLAS_VERSION = 3
+
+# Each folder is packed onto its own pages, so a page can be freed once nothing from its folder is in use.
+# Pages are at most this big; anything taller than MAX_PACKED or wider than a page (the backgrounds and long
+# sprite sheets) gets a page of its own
+PAGE_SIZE = 1024
+MAX_PACKED = 128
+PADDING = 1
+
+
+def source_files(folder='', sources=None):
+    # Every image under data/images, with the stamps used to tell if the cache is out of date. This runs on every
+    # start, so it sticks to scandir, which has the file types to hand without extra calls
+    if sources is None:
+        sources = {}
+    for entry in sorted(os.scandir(IMAGES_PATH + folder), key=lambda entry: entry.name):
+        if entry.is_dir():
+            source_files(folder + entry.name + '/', sources)
+        elif entry.name.endswith('.png'):
+            stat = entry.stat()
+            sources[folder + entry.name] = [stat.st_mtime_ns, stat.st_size]
+    return sources
+
+
+def pack(sizes):
+    # Returns name -> (page, x, y) and the size of each page
+    placements = {}
+    pages = []
+    folders = {}
+    for name in sizes:
+        folders.setdefault(os.path.dirname(name), {})[name] = sizes[name]
+    for folder in sorted(folders):
+        pack_folder(folders[folder], placements, pages)
+    return placements, pages
+
+
+def pack_folder(sizes, placements, pages):
+    # Shelf packing, tallest images first, onto pages added to the end of the list
+    for name in sorted(sizes):
+        if sizes[name][0] > PAGE_SIZE or sizes[name][1] > MAX_PACKED:
+            pages.append(list(sizes[name]))
+            placements[name] = (len(pages) - 1, 0, 0)
+
+    shared = None
+    shelf_x = shelf_y = shelf_height = 0
+    for name in sorted((name for name in sizes if name not in placements),
+                       key=lambda name: (-sizes[name][1], -sizes[name][0], name)):
+        w, h = sizes[name]
+        if shared is None or shelf_x + w > PAGE_SIZE:
+            shelf_x = 0
+            shelf_y += shelf_height
+            shelf_height = 0
+        if shared is None or shelf_y + h > PAGE_SIZE:
+            pages.append([0, 0])
+            shared = len(pages) - 1
+            shelf_x = shelf_y = shelf_height = 0
+        placements[name] = (shared, shelf_x, shelf_y)
+        # Shared pages grow to fit what is on them
+        pages[shared] = [max(pages[shared][0], shelf_x + w), max(pages[shared][1], shelf_y + h)]
+        shelf_x += w + PADDING
+        shelf_height = max(shelf_height, h + PADDING)
+
+
+def encode_page(page):
+    # The art only uses a handful of colors, so pages are stored as one byte per pixel into a palette (or as RGB
+    # if there are too many colors for that), compressed. Returns the data and the palette
+    # Pixels are read as 32 bit integers (with the fourth byte always 255) so each color is a single int
+    pixels = memoryview(pygame.image.tobytes(page, 'RGBX')).cast('I')
+    colors = set(pixels)
+    if len(colors) > 256:
+        return zlib.compress(pygame.image.tobytes(page, 'RGB')), None
+    palette = sorted(colors)
+    ids = {color: i for i, color in enumerate(palette)}
+    indices = bytes(map(ids.__getitem__, pixels))
+    return zlib.compress(indices), [list(color.to_bytes(4, sys.byteorder)[:3]) for color in palette]
+
+
+def build(sources=None):
+    # Decoding every image once, packing them and writing the pages out. Returns the index and the page data
+    if sources is None:
+        sources = source_files()
+    images = {name: pygame.image.load(IMAGES_PATH + name) for name in sources}
+    placements, page_sizes = pack({name: img.get_size() for name, img in images.items()})
+
+    # Copying pixels as they are rather than blending them, so the pages hold what convert() would have given
+    pages = [pygame.Surface(size, pygame.SRCALPHA) for size in page_sizes]
+    for name, (page, x, y) in placements.items():
+        pages[page].blit(images[name], (x, y), special_flags=pygame.BLEND_RGBA_MAX)
+
+    # Every page goes in one file, found by (offset, length, palette)
+    data = bytearray()
+    page_data = []
+    for page in pages:
+        encoded, palette = encode_page(page)
+        page_data.append([len(data), len(encoded), palette])
+        data += encoded
+
+    index = {
+        'version': ATLAS_VERSION,
+        'sources': sources,
+        'pages': page_sizes,
+        'page_data': page_data,
+        'images': {name: [page, x, y] + list(images[name].get_size()) for name, (page, x, y) in placements.items()},
+    }
+    try:
+        os.makedirs(CACHE_PATH, exist_ok=True)
+        with open(CACHE_PATH + PAGES_FILE, 'wb') as f:
+            f.write(data)
+        with open(CACHE_PATH + INDEX_FILE, 'w') as f:
+            json.dump(index, f)
+    except OSError:
+        # Nowhere to keep the cache, so the pages just packed are used this run and packed again next time
+        pass
+    return index, bytes(data)
+
+
+def load_cache():
+    # The cached index and page data, or None if either is missing or any image was added, removed or changed since
+    sources = source_files()
+    try:
+        with open(CACHE_PATH + INDEX_FILE, 'r') as f:
+            index = json.load(f)
+        with open(CACHE_PATH + PAGES_FILE, 'rb') as f:
+            data = f.read()
+    except (OSError, ValueError):
+        return None, None, sources
+    if index.get('version') != ATLAS_VERSION or index.get('sources') != sources:
+        return None, None, sources
+    offset, length, palette = index['page_data'][-1]
+    if len(data) != offset + length:
+        return None, None, sources
+    return index, data, sources
+
+
+class Atlas:
+    def __init__(self):
+        index, data, sources = load_cache()
+        if not index:
+            index, data = build(sources)
+        self.images = index['images']
+        self.page_sizes = index['pages']
+
+        # The compressed pages are small enough to keep in memory, and are only decoded when needed
+        self.page_data = index['page_data']
+        self.data = data
+
+        # Pages are read in when first needed, and stay loaded only while a subsurface of them is still alive
+        self.pages = WeakValueDictionary()
+
+    def page(self, i):
+        page = self.pages.get(i)
+        if not page:
+            offset, length, palette = self.page_data[i]
+            pixels = zlib.decompress(self.data[offset:offset + length])
+            if palette:
+                page = pygame.image.frombytes(pixels, self.page_sizes[i], 'P')
+                page.set_palette([tuple(color) for color in palette])
+            else:
+                page = pygame.image.frombytes(pixels, self.page_sizes[i], 'RGB')
+            page = page.convert()
+            page.set_colorkey((0, 0, 0))
+            self.pages[i] = page
+        return page
+
+    def image(self, path):
+        page, x, y, w, h = self.images[path]
+        return self.page(page).subsurface(pygame.Rect(x, y, w, h))
+
+
+ATLAS = None
+
+
+def get_atlas():
+    # Loaded on first use, since pages can only be converted once the display exists
+    global ATLAS
+    if not ATLAS:
+        ATLAS = Atlas()
+    return ATLAS
+
+
+if __name__ == '__main__':
+    # python -m scripts.atlas rebuilds the cache up front
+    index, data = build()
+    print('Packed', len(index['images']), 'images onto', len(index['pages']), 'pages,', len(data), 'bytes in',
+          CACHE_PATH)
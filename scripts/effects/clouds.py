@@ -18,12 +18,12 @@ class Cloud:
 
 
 class Clouds:
-    def __init__(self, cloud_images, count=16):
+    def __init__(self, cloud_images, count=16, rng=random):
         self.clouds = []
 
         for i in range(count):
-            self.clouds.append(Cloud((random.random() * 99999, random.random() * 99999), random.choice(cloud_images),
-                                     random.random() * 0.05 + 0.05, random.random() * 0.6 + 0.2))
+            self.clouds.append(Cloud((rng.random() * 99999, rng.random() * 99999), rng.choice(cloud_images),
+                                     rng.random() * 0.05 + 0.05, rng.random() * 0.6 + 0.2))
 
         self.clouds.sort(key=lambda x: x.depth)
 
@@ -0,0 +1,37 @@
+import pygame
+
+from scripts.utils import flipped, FLIP_CACHE
+
+OUTLINE_COLOR = (0, 0, 0, 180)
+OUTLINE_OFFSETS = [(-1, 0), (1, 0), (0, -1), (0, 1)]
+
+# id of image -> (image, baked outline); the image is kept so its id can't be reused
+OUTLINE_CACHE = {}
+
+
+def bake_outline(surf):
+    # The silhouette of the surface stamped one pixel out in each direction, on a surface 1px bigger on every side
+    silhouette = pygame.mask.from_surface(surf).to_surface(setcolor=OUTLINE_COLOR, unsetcolor=(0, 0, 0, 0))
+    outline = pygame.Surface((surf.get_width() + 2, surf.get_height() + 2), pygame.SRCALPHA)
+    for offset in OUTLINE_OFFSETS:
+        outline.blit(silhouette, (1 + offset[0], 1 + offset[1]))
+    return outline
+
+
+def get_outline(img, flip=False):
+    img = flipped(img, flip)
+    if id(img) not in OUTLINE_CACHE:
+        OUTLINE_CACHE[id(img)] = (img, bake_outline(img))
+    return OUTLINE_CACHE[id(img)][1]
+
+
+def uncache_outline(img):
+    # Dropping the outlines of both the image and its mirrored copy
+    if id(img) in FLIP_CACHE:
+        OUTLINE_CACHE.pop(id(FLIP_CACHE[id(img)][1]), None)
+    OUTLINE_CACHE.pop(id(img), None)
+
+
+def blit_outline(surf, img, pos, flip=False):
+    # Blits round positions toward zero, so the outline has to start from the same whole pixel
+    surf.blit(get_outline(img, flip), (int(pos[0]) - 1, int(pos[1]) - 1))
@@ -1,25 +1,82 @@
-class Particle:
-    def __init__(self, game, p_type, pos, velocity=(0, 0), frame=0, change_length=False):
+import math
+import operator
+from array import array
+from itertools import compress, repeat
+
+# Per-particle fields, each stored in its own array
+FIELDS = (('x', 'd'), ('y', 'd'), ('vx', 'd'), ('vy', 'd'), ('frame', 'i'), ('last_frame', 'i'),
+          ('img_duration', 'i'), ('type', 'B'))
+
+
+class Particles:
+    def __init__(self, game):
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = velocity
-        self.animation = self.game.assets['particle/' + p_type].copy()
-        self.animation.frame = frame
-        self.animation.img_duration = self.animation.img_duration if not change_length else change_length
 
-    def update(self):
-        kill = False
-        if self.animation.done:
-            kill = True
+        # Particle types share their frames, looked up by a small type id
+        self.type_names = []
+        self.type_ids = {}
+        self.images = []
+
+        self.clear()
+
+    def clear(self):
+        # One array per field, all indexed by particle slot
+        for name, typecode in FIELDS:
+            setattr(self, name, array(typecode))
 
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+    def __len__(self):
+        return len(self.x)
 
-        self.animation.update()
+    def get_type_id(self, p_type):
+        if p_type not in self.type_ids:
+            self.type_ids[p_type] = len(self.type_names)
+            self.type_names.append(p_type)
+            self.images.append(self.game.assets['particle/' + p_type].images)
+        return self.type_ids[p_type]
 
-        return kill
+    def spawn(self, p_type, pos, velocity=(0, 0), frame=0, change_length=False):
+        type_id = self.get_type_id(p_type)
+        img_duration = change_length if change_length else self.game.assets['particle/' + p_type].img_duration
+
+        self.x.append(pos[0])
+        self.y.append(pos[1])
+        self.vx.append(velocity[0])
+        self.vy.append(velocity[1])
+        self.frame.append(frame)
+        self.last_frame.append(img_duration * len(self.images[type_id]) - 1)
+        self.img_duration.append(img_duration)
+        self.type.append(type_id)
+
+    def update(self):
+        # Dropping finished particles by packing the live ones together, instead of removing one at a time
+        alive = list(map(operator.lt, self.frame, self.last_frame))
+        if not all(alive):
+            for name, typecode in FIELDS:
+                setattr(self, name, array(typecode, compress(getattr(self, name), alive)))
+
+        # Moving and animating every particle in one pass per field
+        self.frame = array('i', map(operator.add, self.frame, repeat(1)))
+        self.y = array('d', map(operator.add, self.y, self.vy))
+
+        leaf = self.type_ids.get('leaf', -1)
+        if leaf in self.type:
+            # Leaves sway from side to side as they fall
+            self.x = array('d', [x + vx + math.sin(frame * 0.035) * 0.3 if p_type == leaf else x + vx
+                                 for x, vx, frame, p_type in zip(self.x, self.vx, self.frame, self.type)])
+        else:
+            self.x = array('d', map(operator.add, self.x, self.vx))
 
     def render(self, surf, offset=(0, 0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width() // 2, self.pos[1] - offset[1] - img.get_height() // 2))
\ No newline at end of file
+        # Only blitting particles inside the view, all in one batch
+        left = offset[0] - 16
+        top = offset[1] - 16
+        right = offset[0] + surf.get_width() + 16
+        bottom = offset[1] + surf.get_height() + 16
+
+        blits = []
+        for i in range(len(self.x)):
+            if left < self.x[i] < right and top < self.y[i] < bottom:
+                img = self.images[self.type[i]][self.frame[i] // self.img_duration[i]]
+                blits.append((img, (self.x[i] - offset[0] - img.get_width() // 2,
+                                    self.y[i] - offset[1] - img.get_height() // 2)))
+        surf.blits(blits, doreturn=False)
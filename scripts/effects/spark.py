@@ -1,31 +1,60 @@
 import math
+import operator
+from array import array
+from itertools import compress, repeat
 
 import pygame
 
+# Per-spark fields, each stored in its own array (dx, dy is the cached unit direction)
+FIELDS = (('x', 'd'), ('y', 'd'), ('dx', 'd'), ('dy', 'd'), ('speed', 'd'))
 
-class Spark:
-    def __init__(self, pos, angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
+
+class Sparks:
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        for name, typecode in FIELDS:
+            setattr(self, name, array(typecode))
+
+    def __len__(self):
+        return len(self.x)
+
+    def spawn(self, pos, angle, speed):
+        self.x.append(pos[0])
+        self.y.append(pos[1])
+        self.dx.append(math.cos(angle))
+        self.dy.append(math.sin(angle))
+        self.speed.append(speed)
 
     def update(self):
-        self.pos[0] += math.cos(self.angle) * self.speed
-        self.pos[1] += math.sin(self.angle) * self.speed
+        # Moving every spark, then slowing it down
+        self.x = array('d', [x + dx * speed for x, dx, speed in zip(self.x, self.dx, self.speed)])
+        self.y = array('d', [y + dy * speed for y, dy, speed in zip(self.y, self.dy, self.speed)])
+        self.speed = array('d', map(max, repeat(0), map(operator.sub, self.speed, repeat(0.1))))
 
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed
+        # Sparks die once they stop moving
+        alive = list(map(operator.gt, self.speed, repeat(0)))
+        if not all(alive):
+            for name, typecode in FIELDS:
+                setattr(self, name, array(typecode, compress(getattr(self, name), alive)))
 
     def render(self, surf, offset=(0, 0)):
-        render_points = [
-            (self.pos[0] + math.cos(self.angle) * self.speed * 3 - offset[0],
-             self.pos[1] + math.sin(self.angle) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[0],
-             self.pos[1] + math.sin(self.angle + math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-            (self.pos[0] + math.cos(self.angle + math.pi) * self.speed * 3 - offset[0],
-             self.pos[1] + math.sin(self.angle + math.pi) * self.speed * 3 - offset[1]),
-            (self.pos[0] + math.cos(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[0],
-             self.pos[1] + math.sin(self.angle - math.pi * 0.5) * self.speed * 0.5 - offset[1]),
-        ]
-
-        pygame.draw.polygon(surf, (255, 255, 255), render_points)
+        # Building every on-screen diamond at once: long along the direction, short across it
+        left = offset[0] - 16
+        top = offset[1] - 16
+        right = offset[0] + surf.get_width() + 16
+        bottom = offset[1] + surf.get_height() + 16
+
+        ox, oy = offset
+        polygons = [((x + dx * speed * 3 - ox, y + dy * speed * 3 - oy),
+                     (x - dy * speed * 0.5 - ox, y + dx * speed * 0.5 - oy),
+                     (x - dx * speed * 3 - ox, y - dy * speed * 3 - oy),
+                     (x + dy * speed * 0.5 - ox, y - dx * speed * 0.5 - oy))
+                    for x, y, dx, dy, speed in zip(self.x, self.y, self.dx, self.dy, self.speed)
+                    if left < x < right and top < y < bottom]
+
+        # Returning the area drawn over, so it can be outlined
+        drawn = [pygame.draw.polygon(surf, (255, 255, 255), points) for points in polygons]
+        if drawn:
+            return drawn[0].unionall(drawn[1:])
@@ -0,0 +1,20 @@
+import math
+
+import pygame
+
+# (size, radius) -> black surface with a see-through circle in the middle, or None if the circle covers it all
+IRIS_CACHE = {}
+
+
+def iris(size, radius):
+    key = (size, radius)
+    if key not in IRIS_CACHE:
+        if radius > math.hypot(size[0] / 2, size[1] / 2) + 1:
+            IRIS_CACHE[key] = None
+        else:
+            surf = pygame.Surface(size)
+            pygame.draw.circle(surf, (255, 255, 255), (size[0] // 2, size[1] // 2), radius)
+            # Run-length encoding makes blitting the big flat areas cheap
+            surf.set_colorkey((255, 255, 255), pygame.RLEACCEL)
+            IRIS_CACHE[key] = surf
+    return IRIS_CACHE[key]
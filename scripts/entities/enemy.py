@@ -1,11 +1,8 @@
-import random
 import math
 
-import pygame
-
 from scripts.entities.entity import PhysicsEntity
-from scripts.effects.particle import Particle
-from scripts.effects.spark import Spark
+from scripts.effects.outline import blit_outline
+from scripts.utils import flipped
 
 
 class Enemy(PhysicsEntity):
@@ -22,32 +19,13 @@ class Enemy(PhysicsEntity):
 
         self.walking = 0
 
-    def can_see_point(self, point, tilemap):
-        # Getting Points inbetween
-        x1, y1 = point
-        x2, y2 = self.pos
-        distance = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
-        total_time = distance / 15
-        ratio = 15 / distance
-        points = []
-        for t in range(int(total_time) + 1):
-            x = x1 + (x2 - x1) * ratio * t
-            y = y1 + (y2 - y1) * ratio * t
-            points.append((x, y))
-
-        # Checking for blocks
-        for point in points:
-            if tilemap.solid_check(point):
-                return False
-        return True
-
     def can_see_player(self, tilemap, y_range=16):
         distance_from_player = [self.game.player.pos[0] - self.pos[0], self.game.player.pos[1] - self.pos[1]]
 
         if self.flip and 0 > distance_from_player[0] > -128 and abs(distance_from_player[1]) <= y_range:
-            return self.can_see_point(self.game.player.pos, tilemap)
+            return tilemap.can_see_point(self.game.player.pos, self.pos)
         elif not self.flip and 0 < distance_from_player[0] < 128 and abs(distance_from_player[1]) <= y_range:
-            return self.can_see_point(self.game.player.pos, tilemap)
+            return tilemap.can_see_point(self.game.player.pos, self.pos)
         return False
 
     def update(self, tilemap, movement=(0, 0)):
@@ -62,8 +40,8 @@ class Enemy(PhysicsEntity):
             self.walking = max(0, self.walking - 1)
             if not self.walking:
                 self.shoot()
-        elif random.random() < 0.015:
-            self.walking = random.randint(30, 120)
+        elif self.game.random.random() < 0.015:
+            self.walking = self.game.random.randint(30, 120)
 
         super().update(tilemap=tilemap, movement=movement)
 
@@ -72,32 +50,33 @@ class Enemy(PhysicsEntity):
         else:
             self.set_action('idle')
 
-        if random.randint(1, 14500) == 1:
+        if self.game.random.randint(1, 14500) == 1:
             self.shoot()
 
         """  if abs(self.game.player.dashing) >= 50:
             if self.rect().colliderect(self.game.player.rect()):
                 self.game.screenshake = max(17, self.game.screenshake + 1)
                 for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(Spark(self.game.player.rect().center, angle, 2 + random.random()))
-                    self.game.particles.append(Particle(self.game, 'particle', self.game.player.rect().center,
-                                                        velocity=[math.cos(angle + math.pi) * speed * 0.5,
-                                                                  math.sin(angle + math.pi) * speed * 0.5],
-                                                        frame=random.randint(0, 7)))
-                self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-                self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
+                    angle = self.game.random.random() * math.pi * 2
+                    speed = self.game.random.random() * 5
+                    self.game.sparks.spawn(self.game.player.rect().center, angle, 2 + self.game.random.random())
+                    self.game.particles.spawn('particle', self.game.player.rect().center,
+                                              velocity=[math.cos(angle + math.pi) * speed * 0.5,
+                                                        math.sin(angle + math.pi) * speed * 0.5],
+                                              frame=self.game.random.randint(0, 7))
+                self.game.sparks.spawn(self.rect().center, 0, 5 + self.game.random.random())
+                self.game.sparks.spawn(self.rect().center, math.pi, 5 + self.game.random.random())
                 return True  """
 
-        if self.game.player.last_slash in {14, 10}:
+        # Only checking each attack point if the enemy overlaps the attack at all
+        if self.game.player.last_slash in {14, 10} and self.rect().colliderect(self.game.player.slash_rect):
             enemy_rect = self.rect()
             for point in self.game.player.slash_points:
                 if enemy_rect.collidepoint(*point):
                     self.die()
                     return True
 
-        if self.game.player.last_stab in {50, 37}:
+        if self.game.player.last_stab in {50, 37} and self.rect().colliderect(self.game.player.stab_rect):
             enemy_rect = self.rect()
             for point in self.game.player.stab_points:
                 if enemy_rect.collidepoint(*point):
@@ -109,38 +88,41 @@ class Enemy(PhysicsEntity):
         enemy_rect = self.rect()
         self.game.screenshake = max(13, self.game.screenshake + 1)
         for i in range(25):
-            angle = random.random() * math.pi * 2
-            speed = random.random() * 5
-            self.game.sparks.append(Spark(enemy_rect.center, angle, 2 + random.random()))
-            self.game.particles.append(Particle(self.game, 'particle', enemy_rect.center,
-                                                velocity=[math.cos(angle + math.pi) * speed * 0.5,
-                                                          math.sin(angle + math.pi) * speed * 0.5],
-                                                frame=random.randint(0, 7)))
-        self.game.sparks.append(Spark(self.rect().center, 0, 5 + random.random()))
-        self.game.sparks.append(Spark(self.rect().center, math.pi, 5 + random.random()))
+            angle = self.game.random.random() * math.pi * 2
+            speed = self.game.random.random() * 5
+            self.game.sparks.spawn(enemy_rect.center, angle, 2 + self.game.random.random())
+            self.game.particles.spawn('particle', enemy_rect.center,
+                                      velocity=[math.cos(angle + math.pi) * speed * 0.5,
+                                                math.sin(angle + math.pi) * speed * 0.5],
+                                      frame=self.game.random.randint(0, 7))
+        self.game.sparks.spawn(self.rect().center, 0, 5 + self.game.random.random())
+        self.game.sparks.spawn(self.rect().center, math.pi, 5 + self.game.random.random())
 
     def shoot(self):
         dis = (self.game.player.pos[0] - self.pos[0], self.game.player.pos[1] - self.pos[1])
         if abs(dis[1]) < 16:
             if self.flip and dis[0] < 0:
-                self.game.projectiles.append([[self.rect().centerx - 7, self.rect().centery], -1.5, 0])
+                pos = (self.rect().centerx - 7, self.rect().centery)
+                self.game.projectiles.spawn(pos, -1.5)
                 self.game.sfx['shoot'].play()
                 for i in range(4):
-                    self.game.sparks.append(
-                        Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random()))
+                    self.game.sparks.spawn(pos, self.game.random.random() - 0.5 + math.pi,
+                                           2 + self.game.random.random())
             if not self.flip and dis[0] > 0:
-                self.game.projectiles.append([[self.rect().centerx + 7, self.rect().centery], 1.5, 0])
+                pos = (self.rect().centerx + 7, self.rect().centery)
+                self.game.projectiles.spawn(pos, 1.5)
                 self.game.sfx['shoot'].play()
-                self.game.sparks.append(
-                    Spark(self.game.projectiles[-1][0], random.random() - 0.5, 2 + random.random()))
+                self.game.sparks.spawn(pos, self.game.random.random() - 0.5, 2 + self.game.random.random())
 
-    def render(self, surf, offset=(0, 0)):
-        super().render(surf, offset=offset)
+    def render(self, surf, offset=(0, 0), outline_surf=None):
+        super().render(surf, offset=offset, outline_surf=outline_surf)
 
         if self.flip:
-            surf.blit(pygame.transform.flip(self.game.assets['enemy/bow'][0], True, False), (
-                self.rect().centerx - 3 - self.game.assets['enemy/bow'][0].get_width() - offset[0],
-                self.rect().centery - offset[1] - 3))
+            pos = (self.rect().centerx - 3 - self.game.assets['enemy/bow'][0].get_width() - offset[0],
+                   self.rect().centery - offset[1] - 3)
+            surf.blit(flipped(self.game.assets['enemy/bow'][0]), pos)
         else:
-            surf.blit(self.game.assets['enemy/bow'][0],
-                      (self.rect().centerx + 3 - offset[0], self.rect().centery - offset[1] - 3))
+            pos = (self.rect().centerx + 3 - offset[0], self.rect().centery - offset[1] - 3)
+            surf.blit(self.game.assets['enemy/bow'][0], pos)
+        if outline_surf is not None:
+            blit_outline(outline_surf, self.game.assets['enemy/bow'][0], pos, flip=self.flip)
@@ -1,5 +1,7 @@
 import pygame
 
+from scripts.effects.outline import blit_outline
+
 
 class PhysicsEntity:
     def __init__(self, game, e_type, pos, size):
@@ -70,6 +72,8 @@ class PhysicsEntity:
 
         self.animation.update()
 
-    def render(self, surf, offset=(0, 0)):
-        surf.blit(pygame.transform.flip(self.animation.img(), self.flip, False),
-                  (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1]))
+    def render(self, surf, offset=(0, 0), outline_surf=None):
+        pos = (self.pos[0] - offset[0] + self.anim_offset[0], self.pos[1] - offset[1] + self.anim_offset[1])
+        surf.blit(self.animation.img(self.flip), pos)
+        if outline_surf is not None:
+            blit_outline(outline_surf, self.animation.img(), pos, flip=self.flip)
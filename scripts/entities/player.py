@@ -1,10 +1,57 @@
-import random
 import math
 
 import pygame
 
 from scripts.entities.entity import PhysicsEntity
-from scripts.effects.particle import Particle
+
+# Attacks point in whole degrees, so every point they can touch is worked out once here
+ATTACK_ANGLES = 360
+
+
+def arc_offset(direction, spread, distance):
+    angle = math.radians((direction + spread) % 360)
+    return distance * math.cos(angle), distance * math.sin(angle)
+
+
+def build_slash_table():
+    # Per direction: (line of sight point, hit point, spawns a particle) for each point of the arc
+    table = []
+    for direction in range(ATTACK_ANGLES):
+        pattern = []
+        # Outer edge, checked 26 away but hitting 28 away
+        for i in range(-6, 6):
+            pattern.append((arc_offset(direction, i * 5.4, 26), arc_offset(direction, i * 5.4, 28), True))
+        for i in range(-4, 4):
+            offset = arc_offset(direction, i * 5.4, 23)
+            pattern.append((offset, offset, False))
+        for i in range(-3, 3):
+            offset = arc_offset(direction, i * 5.4, 11 + (4 * (i % 2)))
+            pattern.append((offset, offset, False))
+        for i in range(-1, 1):
+            offset = arc_offset(direction, i * 5.4, 2 + (5 * (i % 2)))
+            pattern.append((offset, offset, False))
+        table.append(tuple(pattern))
+    return table
+
+
+def build_stab_table():
+    # Per direction: 15 points in a straight line, 3 apart
+    return [tuple(arc_offset(direction, 0, 5 + i * 3) for i in range(15)) for direction in range(ATTACK_ANGLES)]
+
+
+SLASH_TABLE = build_slash_table()
+STAB_TABLE = build_stab_table()
+
+
+def points_rect(points):
+    # A rect around every point, padded so collidepoint hits inside it are never missed
+    if not points:
+        return pygame.Rect(0, 0, 0, 0)
+    left = min(point[0] for point in points)
+    top = min(point[1] for point in points)
+    right = max(point[0] for point in points)
+    bottom = max(point[1] for point in points)
+    return pygame.Rect(left - 1, top - 1, right - left + 3, bottom - top + 3)
 
 
 class Player(PhysicsEntity):
@@ -21,30 +68,17 @@ class Player(PhysicsEntity):
         self.last_slash = 0
         self.slash_points = []
         self.slash_tri = pygame.Rect(0, 0, 1, 1)
+        self.slash_rect = pygame.Rect(0, 0, 0, 0)
 
         self.stab_position = self.pos
         self.last_stab = 0
         self.stab_points = []
         self.stab_direction = 1
+        self.stab_rect = pygame.Rect(0, 0, 0, 0)
 
     def safe_blocks_below(self, tilemap):
-        # Getting Points inbetween
-        x1, y1 = self.pos[0], self.pos[1] + 144
-        x2, y2 = self.pos
-        distance = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
-        total_time = distance / 15
-        ratio = 15 / distance
-        points = []
-        for t in range(int(total_time) + 1):
-            x = x1 + (x2 - x1) * ratio * t
-            y = y1 + (y2 - y1) * ratio * t
-            points.append((x, y))
-
-        # Checking for blocks
-        for point in points:
-            if tilemap.solid_check(point):
-                return True
-        return False
+        # Any solid tile in the 144 pixels below means the fall isn't fatal
+        return not tilemap.can_see_point((self.pos[0], self.pos[1] + 144), self.pos)
 
     def update(self, tilemap, movement=(0, 0)):
         movement = [movement[0] * 1.2, movement[1] * 1.4]
@@ -85,11 +119,11 @@ class Player(PhysicsEntity):
 
         if abs(self.dashing) in {60, 50}:
             for i in range(20):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 0.5 + 0.5
+                angle = self.game.random.random() * math.pi * 2
+                speed = self.game.random.random() * 0.5 + 0.5
                 pvelocity = [math.cos(angle) * speed, math.sin(angle) * speed]
-                self.game.particles.append(
-                    Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+                self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity,
+                                          frame=self.game.random.randint(0, 7))
         if self.dashing > 0:
             self.dashing = max(0, self.dashing - 1)
         if self.dashing < 0:
@@ -98,9 +132,9 @@ class Player(PhysicsEntity):
             self.velocity[0] = abs(self.dashing) / self.dashing * 8
             if abs(self.dashing) == 51:
                 self.velocity[0] *= 0.1
-            pvelocity = [abs(self.dashing) / self.dashing * random.random() * 3, 0]
-            self.game.particles.append(
-                Particle(self.game, 'particle', self.rect().center, velocity=pvelocity, frame=random.randint(0, 7)))
+            pvelocity = [abs(self.dashing) / self.dashing * self.game.random.random() * 3, 0]
+            self.game.particles.spawn('particle', self.rect().center, velocity=pvelocity,
+                                      frame=self.game.random.randint(0, 7))
 
         if self.velocity[0] > 0:
             self.velocity[0] = max(self.velocity[0] - 0.1, 0)
@@ -143,97 +177,49 @@ class Player(PhysicsEntity):
             else:
                 self.dashing = 60
 
+    def attack_direction(self, mouse_pos):
+        # Whole degrees, to index the attack tables
+        return round(math.degrees(math.atan2(mouse_pos[1] - (self.pos[1] + 10),
+                                             mouse_pos[0] - (self.pos[0] + 7)))) % ATTACK_ANGLES
+
     def slash(self, tilemap, mouse_pos):
         if not self.last_slash:
             self.game.sfx['slash'].play()
-            direction_degrees = math.degrees(math.atan2(mouse_pos[1] - (self.pos[1] + 10), mouse_pos[0] - (self.pos[0] + 7))) % 360
+            pattern = SLASH_TABLE[self.attack_direction(mouse_pos)]
 
             self.slash_points.clear()
-            col_points = []
             starting_point = self.rect().center
-            for i in range(-6, 6):
-                # Getting Point and new Direction (Degrees & Radians)
-                point = [0, 0]
-                new_direction = (direction_degrees + (i * 5.4)) % 360
-                direction_radians = math.radians(new_direction)
-
-                # Finding New points based on 26 away
-                point[0] = starting_point[0] + 26 * math.cos(direction_radians)
-                point[1] = starting_point[1] + 26 * math.sin(direction_radians)
-
-                col_point = [0, 0]
-                col_point[0] = starting_point[0] + 28 * math.cos(direction_radians)
-                col_point[1] = starting_point[1] + 28 * math.sin(direction_radians)
-
+            points = [(starting_point[0] + offset[0], starting_point[1] + offset[1])
+                      for offset, hit, particle in pattern]
+            visible = tilemap.can_see_points(starting_point, points)
+            for (offset, hit, particle), point, seen in zip(pattern, points, visible):
                 # Adding to new list, & Creating Particles
-                if tilemap.can_see_point(self.rect().center, point):
-                    self.game.particles.append(
-                        Particle(self.game, 'particle', point, velocity=(0, 0), frame=random.randint(0, 7)))
-                    self.slash_points.append(col_point)
-            for i in range(-4, 4):
-                # Getting Point and new Direction (Degrees & Radians)
-                point = [0, 0]
-                new_direction = (direction_degrees + (i * 5.4)) % 360
-                direction_radians = math.radians(new_direction)
-
-                point[0] = starting_point[0] + 23 * math.cos(direction_radians)
-                point[1] = starting_point[1] + 23 * math.sin(direction_radians)
-
-                # Adding to new list, & Creating Particles
-                if tilemap.can_see_point(self.rect().center, point):
-                    self.slash_points.append(point)
-            for i in range(-3, 3):
-                # Getting Point and new Direction (Degrees & Radians)
-                point = [0, 0]
-                new_direction = (direction_degrees + (i * 5.4)) % 360
-                direction_radians = math.radians(new_direction)
-
-                point[0] = starting_point[0] + (11 + (4 * (i % 2))) * math.cos(direction_radians)
-                point[1] = starting_point[1] + (11 + (4 * (i % 2))) * math.sin(direction_radians)
-
-                # Adding to new list, & Creating Particles
-                if tilemap.can_see_point(self.rect().center, point):
-                    self.slash_points.append(point)
-            for i in range(-1, 1):
-                # Getting Point and new Direction (Degrees & Radians)
-                point = [0, 0]
-                new_direction = (direction_degrees + (i * 5.4)) % 360
-                direction_radians = math.radians(new_direction)
-
-                point[0] = starting_point[0] + (2 + (5 * (i % 2))) * math.cos(direction_radians)
-                point[1] = starting_point[1] + (2 + (5 * (i % 2))) * math.sin(direction_radians)
-
-                # Adding to new list, & Creating Particles
-                if tilemap.can_see_point(self.rect().center, point):
-                    self.slash_points.append(point)
+                if seen:
+                    if particle:
+                        self.game.particles.spawn('particle', point, velocity=(0, 0),
+                                                  frame=self.game.random.randint(0, 7))
+                    self.slash_points.append([starting_point[0] + hit[0], starting_point[1] + hit[1]])
+            self.slash_rect = points_rect(self.slash_points)
 
             self.last_slash += 14
 
     def stab(self, tilemap, mouse_pos):
         if not self.last_stab:
             self.game.sfx['stab'].play()
-            stab_direction = math.degrees(
-                math.atan2(mouse_pos[1] - (self.pos[1] + 10), mouse_pos[0] - (self.pos[0] + 7))) % 360
+            pattern = STAB_TABLE[self.attack_direction(mouse_pos)]
             self.slash_points.clear()
             self.last_stab += 50
             stab_position = self.rect().center
 
-            for i in range(15):
-                # Getting Point and new Direction (Degrees & Radians)
-                point = [0, 0]
-                direction_radians = math.radians(stab_direction)
-                stab_distance = 5 + i * 3
-
-                # Finding New points based on 26 away
-                point[0] = stab_position[0] + stab_distance * math.cos(direction_radians)
-                point[1] = stab_position[1] + stab_distance * math.sin(direction_radians)
-
+            points = [(stab_position[0] + offset[0], stab_position[1] + offset[1]) for offset in pattern]
+            visible = tilemap.can_see_points(stab_position, points)
+            for point, seen in zip(points, visible):
                 # Adding to new list, & Creating Particles
-                if tilemap.can_see_point(self.rect().center, point):
-                    self.game.particles.append(
-                        Particle(self.game, 'particle', point, velocity=(0, 0),
-                                 frame=random.randint(0, 7), change_length=13))
+                if seen:
+                    self.game.particles.spawn('particle', point, velocity=(0, 0),
+                                              frame=self.game.random.randint(0, 7), change_length=13)
                     self.stab_points.append(point)
+            self.stab_rect = points_rect(self.stab_points)
 
     def reset(self):
         # Getting Movement / Action Vars
@@ -253,6 +239,6 @@ class Player(PhysicsEntity):
 
         self.velocity = [0, 0]
 
-    def render(self, surf, offset=(0, 0)):
+    def render(self, surf, offset=(0, 0), outline_surf=None):
         if abs(self.dashing) <= 50:
-            super().render(surf, offset=offset)
+            super().render(surf, offset=offset, outline_surf=outline_surf)
@@ -0,0 +1,129 @@
+import math
+import operator
+from array import array
+from itertools import compress, repeat
+
+from scripts.effects.outline import get_outline
+
+# Arrows disappear after this many frames if they never hit anything
+LIFETIME = 360
+
+# Per-arrow fields, each stored in its own array. Arrows fly in a straight line, so the position
+# is x + speed * (frame - spawn_frame), and the frame they stop at is known when they are fired.
+FIELDS = (('x', 'd'), ('y', 'd'), ('speed', 'd'), ('spawn_frame', 'l'), ('end_frame', 'l'), ('hits_wall', 'B'))
+
+
+class Projectiles:
+    def __init__(self, game):
+        self.game = game
+        self.frame = 0
+        self.clear()
+
+    def clear(self):
+        for name, typecode in FIELDS:
+            setattr(self, name, array(typecode))
+        self.next_end = math.inf
+
+    def __len__(self):
+        return len(self.x)
+
+    def spawn(self, pos, speed):
+        impact = self.impact_frame(pos, speed)
+
+        self.x.append(pos[0])
+        self.y.append(pos[1])
+        self.speed.append(speed)
+        self.spawn_frame.append(self.frame)
+        self.end_frame.append(self.frame + (impact if impact else LIFETIME + 1))
+        self.hits_wall.append(1 if impact else 0)
+        self.next_end = min(self.next_end, self.end_frame[-1])
+
+    def impact_frame(self, pos, speed):
+        # Walking the tiles along the arrow's row until one is solid, and working out the frame it enters it
+        tile_size = self.game.tilemap.tile_size
+        first = int(pos[0] // tile_size)
+        last = int((pos[0] + speed * (LIFETIME + 1)) // tile_size)
+        step = 1 if speed > 0 else -1
+        for column in range(first, last + step, step):
+            if speed > 0:
+                frame = max(1, math.ceil((column * tile_size - pos[0]) / speed))
+            else:
+                frame = max(1, math.floor(((column + 1) * tile_size - pos[0]) / speed) + 1)
+            if frame > LIFETIME + 1:
+                break
+            if self.game.tilemap.solid_check((pos[0] + speed * frame, pos[1])):
+                return frame
+        return 0
+
+    def position(self, i):
+        return self.x[i] + self.speed[i] * (self.frame - self.spawn_frame[i]), self.y[i]
+
+    def update(self):
+        self.frame += 1
+
+        if self.frame >= self.next_end:
+            self.expire()
+
+        if abs(self.game.player.dashing) < 50 and len(self.x):
+            self.check_player()
+
+    def expire(self):
+        # Removing every arrow that reached its end frame, with sparks for the ones that hit a wall
+        alive = list(map(operator.gt, self.end_frame, repeat(self.frame)))
+        for i in range(len(alive)):
+            if not alive[i] and self.hits_wall[i]:
+                pos = self.position(i)
+                for j in range(4):
+                    self.game.sparks.spawn(pos, self.game.random.random() - 0.5 + (math.pi if self.speed[i] > 0 else 0),
+                                           2 + self.game.random.random())
+        self.remove(alive)
+
+    def remove(self, alive):
+        for name, typecode in FIELDS:
+            setattr(self, name, array(typecode, compress(getattr(self, name), alive)))
+        self.next_end = min(self.end_frame) if len(self.end_frame) else math.inf
+
+    def check_player(self):
+        # Only arrows flying at the player's height can hit, so the rest are skipped without moving them
+        player_rect = self.game.player.rect()
+        nearby = [i for i, y in enumerate(self.y) if player_rect.top - 1 <= y <= player_rect.bottom]
+        if not nearby:
+            return
+
+        alive = [True] * len(self.x)
+        for i in nearby:
+            if player_rect.collidepoint(self.position(i)):
+                alive[i] = False
+                self.hit_player()
+        if not all(alive):
+            self.remove(alive)
+
+    def hit_player(self):
+        game = self.game
+        game.sfx['hit'].play()
+        game.dead += 1
+        game.screenshake = max(35, game.screenshake + 35)
+        for i in range(30):
+            angle = game.random.random() * math.pi * 2
+            speed = game.random.random() * 5
+            game.sparks.spawn(game.player.rect().center, angle, 2 + game.random.random())
+            game.particles.spawn('particle', game.player.rect().center,
+                                 velocity=[math.cos(angle + math.pi) * speed * 0.5,
+                                           math.sin(angle + math.pi) * speed * 0.5],
+                                 frame=game.random.randint(0, 7))
+
+    def render(self, surf, offset=(0, 0), outline_surf=None):
+        img = self.game.assets['enemy/arrow'][0]
+        left = offset[0] - img.get_width()
+        right = offset[0] + surf.get_width() + img.get_width()
+
+        blits = []
+        for i in range(len(self.x)):
+            x, y = self.position(i)
+            if left < x < right:
+                blits.append((img, (x - img.get_width() / 2 - offset[0], y - img.get_height() / 2 - offset[1])))
+        surf.blits(blits, doreturn=False)
+
+        if outline_surf is not None and blits:
+            outline = get_outline(img)
+            outline_surf.blits([(outline, (int(pos[0]) - 1, int(pos[1]) - 1)) for arrow, pos in blits], doreturn=False)
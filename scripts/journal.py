@@ -0,0 +1,128 @@
+import struct
+from collections import deque
+
+# Undo history is dropped oldest first once the packed strokes take up more than this many bytes
+JOURNAL_BUDGET = 1024 * 1024
+
+# A stroke is packed as its counts, then (x, y, tile before, tile after) for grid tiles and
+# (added, x, y, tile) for off-grid tiles. Tiles are ids into the journal's table, with EMPTY for no tile.
+STROKE_HEADER = struct.Struct('<II')
+TILE_CHANGE = struct.Struct('<hhHH')
+OFFGRID_CHANGE = struct.Struct('<BddH')
+EMPTY = 0xFFFF
+
+
+class EditJournal:
+    def __init__(self, budget=JOURNAL_BUDGET):
+        self.budget = budget
+
+        # (type, variant) <-> id
+        self.tiles = []
+        self.tile_ids = {}
+
+        self.undo_strokes = deque()
+        self.redo_strokes = []
+        self.size = 0
+
+        # The stroke being recorded: position -> [tile before, tile after], and off-grid changes in order
+        self.stroke_tiles = None
+        self.stroke_offgrid = None
+
+    def clear(self):
+        self.undo_strokes.clear()
+        self.redo_strokes.clear()
+        self.size = 0
+        self.stroke_tiles = self.stroke_offgrid = None
+
+    def tile_id(self, tile):
+        if not tile:
+            return EMPTY
+        tile = (tile[0], tile[1])
+        if tile not in self.tile_ids:
+            self.tile_ids[tile] = len(self.tiles)
+            self.tiles.append(tile)
+        return self.tile_ids[tile]
+
+    def begin(self):
+        if self.stroke_tiles is None:
+            self.stroke_tiles = {}
+            self.stroke_offgrid = []
+
+    def record_tile(self, pos, before, after):
+        # Painting over a tile many times in one stroke keeps only the first before and last after
+        self.begin()
+        pos = (pos[0], pos[1])
+        if pos in self.stroke_tiles:
+            self.stroke_tiles[pos][1] = after
+        elif before != after:
+            self.stroke_tiles[pos] = [before, after]
+
+    def record_offgrid(self, tile, added):
+        self.begin()
+        self.stroke_offgrid.append((added, tile))
+
+    def end(self):
+        if self.stroke_tiles is None:
+            return
+        tiles = [(pos, change) for pos, change in self.stroke_tiles.items() if change[0] != change[1]]
+        offgrid = self.stroke_offgrid
+        self.stroke_tiles = self.stroke_offgrid = None
+        if not tiles and not offgrid:
+            return
+
+        data = bytearray(STROKE_HEADER.pack(len(tiles), len(offgrid)))
+        for pos, (before, after) in tiles:
+            data += TILE_CHANGE.pack(pos[0], pos[1], self.tile_id(before), self.tile_id(after))
+        for added, tile in offgrid:
+            data += OFFGRID_CHANGE.pack(added, tile['pos'][0], tile['pos'][1],
+                                        self.tile_id((tile['type'], tile['variant'])))
+
+        self.redo_strokes.clear()
+        self.push(bytes(data))
+
+    def push(self, stroke):
+        self.undo_strokes.append(stroke)
+        self.size += len(stroke)
+        while self.size > self.budget and len(self.undo_strokes) > 1:
+            self.size -= len(self.undo_strokes.popleft())
+
+    def undo(self, tilemap):
+        self.end()
+        if self.undo_strokes:
+            stroke = self.undo_strokes.pop()
+            self.size -= len(stroke)
+            self.apply(tilemap, stroke, reverse=True)
+            self.redo_strokes.append(stroke)
+
+    def redo(self, tilemap):
+        self.end()
+        if self.redo_strokes:
+            stroke = self.redo_strokes.pop()
+            self.apply(tilemap, stroke, reverse=False)
+            self.push(stroke)
+
+    def apply(self, tilemap, stroke, reverse):
+        tile_count, offgrid_count = STROKE_HEADER.unpack_from(stroke, 0)
+        offset = STROKE_HEADER.size
+        tiles = list(TILE_CHANGE.iter_unpack(stroke[offset:offset + tile_count * TILE_CHANGE.size]))
+        offset += tile_count * TILE_CHANGE.size
+        offgrid = list(OFFGRID_CHANGE.iter_unpack(stroke[offset:offset + offgrid_count * OFFGRID_CHANGE.size]))
+
+        if reverse:
+            offgrid.reverse()
+        for added, x, y, tile in offgrid:
+            tile_type, variant = self.tiles[tile]
+            if added != reverse:
+                tilemap.add_offgrid({'type': tile_type, 'variant': variant, 'pos': [x, y]})
+            else:
+                for match in tilemap.offgrid_tiles:
+                    if match['type'] == tile_type and match['variant'] == variant and tuple(match['pos']) == (x, y):
+                        tilemap.remove_offgrid(match)
+                        break
+
+        for x, y, before, after in tiles:
+            tile = before if reverse else after
+            if tile == EMPTY:
+                tilemap.remove_tile((x, y))
+            else:
+                tilemap.set_tile((x, y), *self.tiles[tile])
@@ -0,0 +1,102 @@
+import os
+import sys
+import json
+import mmap
+import struct
+
+# Binary maps: a header, the type names once each, then fixed size records that refer to types by index.
+# Grid tiles are (x, y, type, variant) with 16-bit coordinates, and off-grid tiles keep their exact float position.
+MAGIC = b'NSMP'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHII')
+TYPE_NAME = struct.Struct('<B')
+GRID_TILE = struct.Struct('<hhBB')
+OFFGRID_TILE = struct.Struct('<ddBB')
+
+
+def write_map(path, tile_size, background, tilemap, offgrid):
+    # tilemap is (x, y) -> (type, variant), offgrid is a list of {'type', 'variant', 'pos'}
+    types = sorted({tile[0] for tile in tilemap.values()} | {tile['type'] for tile in offgrid})
+    type_ids = {name: i for i, name in enumerate(types)}
+
+    data = bytearray(HEADER.pack(MAGIC, VERSION, tile_size, background, len(types), len(tilemap), len(offgrid)))
+    for name in types:
+        encoded = name.encode('utf-8')
+        data += TYPE_NAME.pack(len(encoded)) + encoded
+    for loc, tile in tilemap.items():
+        data += GRID_TILE.pack(loc[0], loc[1], type_ids[tile[0]], tile[1])
+    for tile in offgrid:
+        data += OFFGRID_TILE.pack(tile['pos'][0], tile['pos'][1], type_ids[tile['type']], tile['variant'])
+
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def read_map(path, use_mmap=True):
+    # Returns (tile_size, background, grid tiles as (x, y, type, variant), offgrid tiles)
+    with open(path, 'rb') as f:
+        if use_mmap and os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return parse_map(data)
+        return parse_map(f.read())
+
+
+def parse_map(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Not a map file: too short")
+    magic, version, tile_size, background, type_count, tile_count, offgrid_count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a map file, or an unsupported version")
+
+    offset = HEADER.size
+    types = []
+    for i in range(type_count):
+        length = TYPE_NAME.unpack_from(data, offset)[0]
+        offset += TYPE_NAME.size
+        types.append(bytes(data[offset:offset + length]).decode('utf-8'))
+        offset += length
+
+    end = offset + tile_count * GRID_TILE.size
+    tiles = [(x, y, types[type_id], variant)
+             for x, y, type_id, variant in GRID_TILE.iter_unpack(data[offset:end])]
+    offset = end
+
+    end = offset + offgrid_count * OFFGRID_TILE.size
+    offgrid = [{'type': types[type_id], 'variant': variant, 'pos': [x, y]}
+               for x, y, type_id, variant in OFFGRID_TILE.iter_unpack(data[offset:end])]
+    return tile_size, background, tiles, offgrid
+
+
+def convert(json_path, map_path=None):
+    # Converting a JSON map to the binary format, next to it unless told otherwise
+    if not map_path:
+        map_path = os.path.splitext(json_path)[0] + '.map'
+    with open(json_path, 'r') as f:
+        map_data = json.load(f)
+    tilemap = {(tile['pos'][0], tile['pos'][1]): (tile['type'], tile['variant'])
+               for tile in map_data['tilemap'].values()}
+    write_map(map_path, map_data['tile_size'], map_data['background'], tilemap, map_data['offgrid'])
+    return map_path
+
+
+def map_path(directory, map_id):
+    # Levels can be saved in either format; if both exist the one saved last wins
+    paths = [path for path in (os.path.join(directory, str(map_id) + extension) for extension in ('.map', '.json'))
+             if os.path.exists(path)]
+    if not paths:
+        return os.path.join(directory, str(map_id) + '.json')
+    return max(paths, key=os.path.getmtime)
+
+
+def map_count(directory):
+    # The same level may exist in both formats, so levels are counted by name
+    return len({os.path.splitext(name)[0] for name in os.listdir(directory)})
+
+
+if __name__ == '__main__':
+    # python -m scripts.mapfile data/maps/14.json ... converts the given maps, or every JSON map with no arguments
+    paths = sys.argv[1:] or sorted(os.path.join('data/maps', name) for name in os.listdir('data/maps')
+                                   if name.endswith('.json'))
+    for path in paths:
+        new_path = convert(path)
+        print(path, '->', new_path, '(' + str(os.path.getsize(path)), '->', os.path.getsize(new_path), 'bytes)')
@@ -0,0 +1,37 @@
+import threading
+
+from scripts.tilemap import read_level
+
+
+class LevelPrefetcher:
+    def __init__(self):
+        # Path -> worker thread, and path -> parsed level (or the error reading it)
+        self.threads = {}
+        self.results = {}
+
+    def prefetch(self, path):
+        # Reading and parsing a level on a worker thread, so it is ready by the time it is needed
+        if path not in self.threads and path not in self.results:
+            self.threads[path] = threading.Thread(target=self.work, args=(path,), daemon=True)
+            self.threads[path].start()
+
+    def work(self, path):
+        try:
+            self.results[path] = read_level(path)
+        except Exception as e:
+            self.results[path] = e
+
+    def take(self, path):
+        # The prefetched level, waiting for the worker if it hasn't finished, or None if it was never prefetched
+        if path in self.threads:
+            self.threads.pop(path).join()
+        level = self.results.pop(path, None)
+        if isinstance(level, Exception):
+            raise level
+        return level
+
+    def clear(self):
+        for thread in self.threads.values():
+            thread.join()
+        self.threads.clear()
+        self.results.clear()
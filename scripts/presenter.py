@@ -0,0 +1,29 @@
+import pygame
+
+
+class Presenter:
+    def __init__(self, screen, size, scale=4):
+        # Scales a low resolution surface of the given size up to the window, reusing the same buffers every frame
+        self.screen = screen
+        self.scale = int(scale)
+        self.size = (size[0] * self.scale, size[1] * self.scale)
+
+        # Scaling straight into the window saves a copy, when nothing needs shifting and the formats line up
+        self.target = None
+        self.direct = screen.get_size() == self.size
+
+    def present(self, surf, offset=(0, 0)):
+        offset = (int(offset[0]), int(offset[1]))
+        if self.direct and offset == (0, 0):
+            try:
+                pygame.transform.scale(surf, self.size, self.screen)
+                pygame.display.update()
+                return
+            except ValueError:
+                # The window uses a different pixel format, so every frame goes through the target instead
+                self.direct = False
+
+        if not self.target:
+            self.target = pygame.Surface(self.size, 0, surf)
+        pygame.transform.scale(surf, self.size, self.target)
+        pygame.display.update(self.screen.blit(self.target, offset))
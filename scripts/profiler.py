@@ -0,0 +1,207 @@
+import sys
+import csv
+import json
+import time
+import tracemalloc
+from collections import deque
+
+import pygame
+
+from scripts.atlas import get_atlas
+from scripts.utils import FLIP_CACHE
+from scripts.effects.outline import OUTLINE_CACHE
+
+OVERLAY_COLOR = (255, 255, 255)
+OVERLAY_BACKGROUND = (0, 0, 0, 160)
+
+
+class Profiler:
+    def __init__(self, enabled=False, history=60, keep_frames=False):
+        # While disabled every call returns straight away, so the marks can stay in the frame loop
+        self.enabled = enabled
+        self.enabled_before_overlay = enabled
+        self.overlay = False
+
+        # Stage name -> seconds for the frame being timed, the last few frames for the overlay,
+        # and every frame if they are being kept for export
+        self.current = {}
+        self.history = deque(maxlen=history)
+        self.keep_frames = keep_frames
+        self.frames = []
+        self.stages = []
+
+        self.last = 0
+        self.font = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+        self.current = {}
+        self.last = time.perf_counter()
+
+    def mark(self, name):
+        # Everything since the last mark (or the start of the frame) is counted towards this stage
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.current[name] = self.current.get(name, 0) + now - self.last
+        self.last = now
+
+    def end_frame(self):
+        if not self.enabled or not self.current:
+            return
+        for name in self.current:
+            if name not in self.stages:
+                self.stages.append(name)
+        self.history.append(self.current)
+        if self.keep_frames:
+            self.frames.append(self.current)
+        self.current = {}
+
+    def toggle_overlay(self):
+        self.overlay = not self.overlay
+        if self.overlay:
+            self.enabled_before_overlay = self.enabled
+            if not self.enabled:
+                # Timing starts from here, part way through the frame
+                self.enabled = True
+                self.history.clear()
+                self.begin_frame()
+        else:
+            # Timing only carries on after hiding the overlay if it was already running, e.g. for an export
+            self.enabled = self.enabled_before_overlay
+
+    def averages(self):
+        # Rolling mean of each stage in milliseconds
+        if not self.history:
+            return {}
+        return {name: sum(frame.get(name, 0) for frame in self.history) / len(self.history) * 1000
+                for name in self.stages}
+
+    def render(self, surf):
+        if not self.overlay or not self.history:
+            return
+        if not self.font:
+            self.font = pygame.font.Font(None, 12)
+
+        averages = self.averages()
+        lines = [name + ': ' + format(ms, '.2f') for name, ms in averages.items()]
+        lines.append('total: ' + format(sum(averages.values()), '.2f') + ' ms')
+
+        images = [self.font.render(line, False, OVERLAY_COLOR) for line in lines]
+        panel = pygame.Surface((max(img.get_width() for img in images) + 4, len(images) * 8 + 4), pygame.SRCALPHA)
+        panel.fill(OVERLAY_BACKGROUND)
+        for i, img in enumerate(images):
+            panel.blit(img, (2, 2 + i * 8))
+        surf.blit(panel, (2, 2))
+
+    def export(self, path):
+        # One row per frame, with a column per stage in milliseconds, as CSV or JSON by file extension
+        rows = [[round(frame.get(name, 0) * 1000, 4) for name in self.stages] for frame in self.frames]
+        if path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump({'stages': self.stages, 'frames': rows}, f)
+        else:
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame'] + self.stages)
+                for i, row in enumerate(rows):
+                    writer.writerow([i] + row)
+
+
+class AllocationProfiler(Profiler):
+    def __init__(self, history=60, keep_frames=False, snapshot_every=60, exclude=()):
+        # Timings as usual, plus per stage what was allocated (traced with tracemalloc, so everything runs slower).
+        # Short-lived objects are caught by the peak memory inside each stage, and anything that sticks around
+        # is tracked to the line that allocated it by comparing snapshots every few frames
+        super().__init__(enabled=True, history=history, keep_frames=keep_frames)
+        self.snapshot_every = snapshot_every
+
+        # The profiler's own bookkeeping, and any other files given (like the script driving the game), are left
+        # out of the snapshots so only the game's memory is compared
+        self.filters = [tracemalloc.Filter(False, filename) for filename in (tracemalloc.__file__, __file__)]
+        self.filters += [tracemalloc.Filter(False, filename) for filename in exclude]
+
+        # Stage name -> [total peak bytes allocated on top of what the stage started with, total bytes kept,
+        # frames seen]
+        self.allocations = {}
+        self.memory_last = 0
+        self.frame_count = 0
+        self.snapshot = None
+        self.growth = {}
+
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def begin_frame(self):
+        super().begin_frame()
+        self.memory_last = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+
+    def mark(self, name):
+        super().mark(name)
+        current, peak = tracemalloc.get_traced_memory()
+        stage = self.allocations.setdefault(name, [0, 0, 0])
+        stage[0] += peak - self.memory_last
+        stage[1] += current - self.memory_last
+        stage[2] += 1
+        self.memory_last = current
+        tracemalloc.reset_peak()
+
+    def end_frame(self):
+        super().end_frame()
+        self.frame_count += 1
+        if self.frame_count % self.snapshot_every == 0:
+            snapshot = tracemalloc.take_snapshot().filter_traces(self.filters)
+            if self.snapshot:
+                # Lines still holding on to more memory than last time
+                for stat in snapshot.compare_to(self.snapshot, 'lineno'):
+                    if stat.size_diff > 0:
+                        line = str(stat.traceback[0])
+                        self.growth[line] = self.growth.get(line, 0) + stat.size_diff
+            self.snapshot = snapshot
+
+    def drop_snapshot(self):
+        # Starting the comparison over, after something like reloading a level that isn't the game holding on
+        # to memory
+        self.snapshot = None
+
+    def stage_allocations(self):
+        # Stage name -> (peak bytes allocated per frame, bytes kept per frame), worst first
+        stages = {name: (churn / frames, kept / frames) for name, (churn, kept, frames) in self.allocations.items()}
+        return dict(sorted(stages.items(), key=lambda item: -item[1][0]))
+
+    def over_budget(self, budget=0):
+        # Stages that allocate more than the budget per frame, to hold the frame loop to it
+        return [name for name, (churn, kept) in self.stage_allocations().items() if churn > budget]
+
+    def report(self, top=10):
+        lines = ['Allocations per frame, by stage:']
+        for name, (churn, kept) in list(self.stage_allocations().items())[:top]:
+            lines.append('  ' + name + ': ' + format(churn, '.0f') + ' bytes at peak, ' + format(kept, '+.0f') +
+                         ' bytes kept')
+        lines.append('Lines still holding on to more memory, over ' + str(self.frame_count) + ' frames:')
+        for line, size in sorted(self.growth.items(), key=lambda item: -item[1])[:top]:
+            lines.append('  ' + line + ': +' + str(size) + ' bytes')
+        return '\n'.join(lines)
+
+
+def surface_bytes(surf):
+    return surf.get_width() * surf.get_height() * surf.get_bytesize()
+
+
+def resident_memory(game):
+    # Rough bytes held by the game's caches and level data, for the parts worth keeping an eye on
+    atlas = get_atlas()
+    tilemap = game.tilemap
+    return {
+        'assets loaded': sum(game.assets.sizes.values()),
+        'atlas pages': sum(surface_bytes(page) for page in atlas.pages.values()),
+        'tile chunks': sum(surface_bytes(chunk) for chunk in tilemap.chunks.values() if chunk),
+        'chunk outlines': sum(surface_bytes(outline) for outline in tilemap.chunk_outlines.values()),
+        'flipped sprites': sum(surface_bytes(entry[1]) for entry in FLIP_CACHE.values()),
+        'sprite outlines': sum(surface_bytes(entry[1]) for entry in OUTLINE_CACHE.values()),
+        'tilemap': sys.getsizeof(tilemap.tilemap) + sum(sys.getsizeof(loc) for loc in tilemap.tilemap),
+        'offgrid tiles': sys.getsizeof(tilemap.offgrid_tiles) + sum(sys.getsizeof(tile)
+                                                                   for tile in tilemap.offgrid_tiles),
+    }
@@ -0,0 +1,98 @@
+import struct
+import zlib
+
+import pygame
+
+# Replays hold the seed and length of the run, every input event by frame, and a hash of the game state after
+# each frame, so playing one back shows the first frame where anything turned out differently
+MAGIC = b'NSRP'
+VERSION = 3
+# (magic, version, seed, frames, events). Seeds are unsigned 64 bit, the range game.py accepts for --seed
+HEADER = struct.Struct('<4sHQII')
+FRAME_HASH = struct.Struct('<I')
+
+# (frame, event type, key or button, mouse x, mouse y). Keys need all 32 bits, as pygame numbers keys like shift
+# and F3 from 2 ** 30 up
+EVENT = struct.Struct('<IBIHH')
+
+# Only the events the game reacts to are kept
+EVENT_TYPES = [pygame.KEYDOWN, pygame.KEYUP, pygame.MOUSEBUTTONDOWN]
+
+
+def state_hash(game):
+    # Everything that decides what happens next, as a CRC of its repr
+    player = game.player
+    state = (game.level, game.dead, game.transition, game.screenshake, game.scroll, player.pos, player.velocity,
+             player.flip, player.action, player.dashing, player.jumps, player.air_time,
+             player.last_slash, player.last_stab, game.movement,
+             [(enemy.color, enemy.pos, enemy.velocity, enemy.flip, enemy.walking, enemy.action)
+              for enemy in game.enemies],
+             game.projectiles.frame, list(game.projectiles.x), list(game.projectiles.y),
+             list(game.projectiles.spawn_frame), list(game.sparks.x), list(game.sparks.y), len(game.particles))
+    return zlib.crc32(repr(state).encode('utf-8'))
+
+
+def pack_event(frame, event):
+    if event.type == pygame.MOUSEBUTTONDOWN:
+        return EVENT.pack(frame, 2, event.button, event.pos[0], event.pos[1])
+    return EVENT.pack(frame, EVENT_TYPES.index(event.type), event.key, 0, 0)
+
+
+def unpack_event(data):
+    frame, event_type, code, x, y = data
+    if EVENT_TYPES[event_type] == pygame.MOUSEBUTTONDOWN:
+        return frame, pygame.event.Event(pygame.MOUSEBUTTONDOWN, button=code, pos=(x, y))
+    return frame, pygame.event.Event(EVENT_TYPES[event_type], key=code)
+
+
+class InputRecorder:
+    def __init__(self, path, seed):
+        self.path = path
+        self.seed = seed
+        self.frame = 0
+        self.events = bytearray()
+        self.event_count = 0
+        self.hashes = bytearray()
+
+    def record(self, events, game):
+        # Called once per step, with that step's events, after the step has run
+        for event in events:
+            if event.type in EVENT_TYPES:
+                self.events += pack_event(self.frame, event)
+                self.event_count += 1
+        self.hashes += FRAME_HASH.pack(state_hash(game))
+        self.frame += 1
+
+    def save(self):
+        with open(self.path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.seed, self.frame, self.event_count))
+            f.write(self.events)
+            f.write(self.hashes)
+
+
+class Replay:
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.seed, self.frames, event_count = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a replay file, or an unsupported version")
+
+        offset = HEADER.size
+        self.events = {}
+        for event_data in EVENT.iter_unpack(data[offset:offset + event_count * EVENT.size]):
+            frame, event = unpack_event(event_data)
+            self.events.setdefault(frame, []).append(event)
+        offset += event_count * EVENT.size
+        hashes = data[offset:offset + self.frames * FRAME_HASH.size]
+        self.hashes = [entry[0] for entry in FRAME_HASH.iter_unpack(hashes)]
+
+    def play(self, game, render=False):
+        # Steps the game through every recorded frame. Returns the first frame whose state differs from the
+        # recording, or None if they all match
+        mismatch = None
+        for frame in range(self.frames):
+            game.step(self.events.get(frame, []), render=render)
+            if mismatch is None and state_hash(game) != self.hashes[frame]:
+                mismatch = frame
+        return mismatch
@@ -0,0 +1,64 @@
+class SpatialHash:
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+
+        # Cell -> list of (order, item), and id(item) -> (cell, order, pos)
+        self.cells = {}
+        self.entries = {}
+        self.counter = 0
+
+    def cell_at(self, pos):
+        return int(pos[0] // self.cell_size), int(pos[1] // self.cell_size)
+
+    def insert(self, item, pos):
+        cell = self.cell_at(pos)
+        self.counter += 1
+        self.entries[id(item)] = (cell, self.counter, pos)
+        self.cells.setdefault(cell, []).append((self.counter, item))
+
+    def remove(self, item):
+        cell, order, pos = self.entries.pop(id(item))
+        self.remove_from_cell(item, cell)
+
+    def remove_from_cell(self, item, cell):
+        bucket = self.cells[cell]
+        for i in range(len(bucket)):
+            if bucket[i][1] is item:
+                del bucket[i]
+                break
+        if not bucket:
+            del self.cells[cell]
+
+    def move(self, item, pos):
+        # Only touching the buckets when the item changes cell, and keeping its place in the order
+        cell, order, old_pos = self.entries[id(item)]
+        new_cell = self.cell_at(pos)
+        if new_cell != cell:
+            self.remove_from_cell(item, cell)
+            self.cells.setdefault(new_cell, []).append((order, item))
+        self.entries[id(item)] = (new_cell, order, pos)
+
+    def clear(self):
+        self.cells.clear()
+        self.entries.clear()
+
+    def query_rect(self, rect):
+        # Every item whose position falls in a cell touching the rect, in insertion order
+        matches = []
+        left, top = self.cell_at((rect[0], rect[1]))
+        right, bottom = self.cell_at((rect[0] + rect[2], rect[1] + rect[3]))
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                if (cx, cy) in self.cells:
+                    matches.extend(self.cells[(cx, cy)])
+        matches.sort(key=lambda entry: entry[0])
+        return [entry[1] for entry in matches]
+
+    def query_radius(self, pos, radius):
+        # Items within the radius of a point, using the position they were last inserted or moved to
+        matches = []
+        for item in self.query_rect((pos[0] - radius, pos[1] - radius, radius * 2, radius * 2)):
+            item_pos = self.entries[id(item)][2]
+            if ((pos[0] - item_pos[0]) ** 2 + (pos[1] - item_pos[1]) ** 2) ** 0.5 <= radius:
+                matches.append(item)
+        return matches
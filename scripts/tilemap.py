@@ -1,7 +1,14 @@
+import sys
 import json
+import math
+from collections import OrderedDict
 
 import pygame
 
+from scripts.spatial import SpatialHash
+from scripts.mapfile import read_map, write_map
+from scripts.effects.outline import bake_outline, blit_outline
+
 AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (0, 1)])): 0,
     tuple(sorted([(1, 0), (0, 1), (-1, 0)])): 1,
@@ -14,10 +21,61 @@ AUTOTILE_MAP = {
     tuple(sorted([(1, 0), (-1, 0), (0, 1), (0, -1)])): 8,
 }
 
+# Autotiling looks up a 4-bit mask of which sides have a tile of the same type
+AUTOTILE_BITS = {(1, 0): 1, (-1, 0): 2, (0, -1): 4, (0, 1): 8}
+
+
+def build_autotile_table():
+    table = [None] * 16
+    for neighbors, variant in AUTOTILE_MAP.items():
+        table[sum(AUTOTILE_BITS[shift] for shift in neighbors)] = variant
+    return table
+
+
+AUTOTILE_TABLE = build_autotile_table()
+
 NEIGHBOR_OFFSETS = [(-1, 0), (-1, -1), (0, -1), (1, -1), (1, 0), (0, 0), (-1, 1), (0, 1), (1, 1)]
 PHYSICS_TILES = {'grass', 'stone'}
 AUTOTILE_TYPES = {'grass', 'stone'}
 
+# On-grid tiles are baked into cached square chunks (in pixels), keeping at most MAX_CHUNKS of them
+CHUNK_SIZE = 256
+MAX_CHUNKS = 32
+# How many tiles an image may spill right or down past its own grid cell (large decor placed on grid)
+CHUNK_OVERDRAW = 3
+
+# Off-grid tiles are bucketed by position, and can reach this many pixels right of and below it
+OFFGRID_CELL_SIZE = 64
+OFFGRID_MARGIN = 48
+
+# Every tile with the same type and variant shares one tuple
+TILE_CACHE = {}
+
+
+def make_tile(tile_type, variant):
+    key = (tile_type, variant)
+    if key not in TILE_CACHE:
+        TILE_CACHE[key] = (sys.intern(tile_type), variant)
+    return TILE_CACHE[key]
+
+
+def read_level(path):
+    # Reading and parsing a map in either format, without touching any tilemap, so it can run on another thread.
+    # Returns (tile_size, background, tiles, offgrid tiles)
+    if path.endswith('.map'):
+        tile_size, background, tiles, offgrid = read_map(path)
+        return tile_size, background, {(x, y): make_tile(tile_type, variant)
+                                       for x, y, tile_type, variant in tiles}, offgrid
+
+    f = open(path, 'r')
+    map_data = json.load(f)
+    f.close()
+
+    tiles = {}
+    for tile in map_data['tilemap'].values():
+        tiles[(tile['pos'][0], tile['pos'][1])] = make_tile(tile['type'], tile['variant'])
+    return map_data['tile_size'], map_data['background'], tiles, map_data['offgrid']
+
 
 class Tilemap:
     def __init__(self, game, tile_size=16):
@@ -27,122 +85,313 @@ class Tilemap:
         self.offgrid_tiles = []
         self.background = 0
 
+        self.offgrid_index = SpatialHash(OFFGRID_CELL_SIZE)
+
+        # Line of sight results for the current frame, keyed by (from tile, to tile)
+        self.sight_cache = {}
+
+        # Chunk position -> baked surface (None if the chunk is empty), least recently used first
+        self.chunks = OrderedDict()
+        self.chunk_outlines = {}
+
+        # Bumped on every change to the tiles, so a snapshot can tell if it still matches
+        self.version = 0
+
+        # Positions whose autotile variant may be out of date, or None if the whole map needs a pass
+        self.autotile_dirty = None
+
     def tiles_around(self, pos):
+        # Tiles are (type, variant) tuples, keyed by integer (x, y) grid positions
         tiles = []
-        tile_loc = (int(pos[0] // self.tile_size), int(pos[1] // self.tile_size))
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ";" + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap:
-                tiles.append(self.tilemap[check_loc])
+            tile = self.tilemap.get((tile_x + offset[0], tile_y + offset[1]))
+            if tile:
+                tiles.append(tile)
         return tiles
 
+    def set_tile(self, pos, tile_type, variant):
+        tile = make_tile(tile_type, variant)
+        if self.tilemap.get((pos[0], pos[1])) is not tile:
+            self.tilemap[(pos[0], pos[1])] = tile
+            self.mark_dirty(pos)
+
+    def remove_tile(self, pos):
+        if (pos[0], pos[1]) in self.tilemap:
+            del self.tilemap[(pos[0], pos[1])]
+            self.mark_dirty(pos)
+
+    def mark_dirty(self, pos):
+        self.version += 1
+        self.sight_cache.clear()
+        if self.autotile_dirty is not None:
+            self.autotile_dirty.add((pos[0], pos[1]))
+            for shift in AUTOTILE_BITS:
+                self.autotile_dirty.add((pos[0] + shift[0], pos[1] + shift[1]))
+
+        # Dropping only the chunks this tile (and anything it spills into) is baked into
+        left = pos[0] * self.tile_size // CHUNK_SIZE
+        top = pos[1] * self.tile_size // CHUNK_SIZE
+        right = ((pos[0] + CHUNK_OVERDRAW + 1) * self.tile_size - 1) // CHUNK_SIZE
+        bottom = ((pos[1] + CHUNK_OVERDRAW + 1) * self.tile_size - 1) // CHUNK_SIZE
+        for cx in range(left, right + 1):
+            for cy in range(top, bottom + 1):
+                self.drop_chunk((cx, cy))
+
+    def add_offgrid(self, tile):
+        self.offgrid_tiles.append(tile)
+        self.offgrid_index.insert(tile, tile['pos'])
+
+    def remove_offgrid(self, tile):
+        self.offgrid_tiles.remove(tile)
+        self.offgrid_index.remove(tile)
+
+    def index_offgrid(self):
+        self.offgrid_index.clear()
+        for tile in self.offgrid_tiles:
+            self.offgrid_index.insert(tile, tile['pos'])
+
+    def offgrid_around(self, pos):
+        # Off-grid tiles whose images could cover the point
+        return self.offgrid_index.query_rect((pos[0] - OFFGRID_MARGIN, pos[1] - OFFGRID_MARGIN,
+                                              OFFGRID_MARGIN, OFFGRID_MARGIN))
+
     def extract(self, id_pairs, keep=False):
         matches = []
         for tile in self.offgrid_tiles.copy():
             if (tile['type'], tile['variant']) in id_pairs:
                 matches.append(tile.copy())
                 if not keep:
-                    self.offgrid_tiles.remove(tile)
+                    self.remove_offgrid(tile)
 
-        for loc in self.tilemap:
+        for loc in list(self.tilemap):
             tile = self.tilemap[loc]
-            if (tile['type'], tile['variant']) in id_pairs:
-                matches.append(tile.copy())
-                matches[-1]['pos'] = matches[-1]['pos'].copy()
-                matches[-1]['pos'][0] *= self.tile_size
-                matches[-1]['pos'][1] *= self.tile_size
+            if tile in id_pairs:
+                matches.append({'type': tile[0], 'variant': tile[1],
+                                'pos': [loc[0] * self.tile_size, loc[1] * self.tile_size]})
                 if not keep:
                     del self.tilemap[loc]
+                    self.mark_dirty(loc)
 
         return matches
 
     def autotile(self):
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1, 0), (-1, 0), (0, -1), (0, 1)]:
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                if check_loc in self.tilemap:
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift)
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                tile['variant'] = AUTOTILE_MAP[neighbors]
+        # Only redoing the tiles painted or erased (and their neighbors) since the last pass, if there was one.
+        # Returns the (position, tile before, tile after) of every tile changed
+        if self.autotile_dirty is None:
+            return self.autotile_all()
+
+        changes = []
+        for loc in self.autotile_dirty:
+            tile = self.tilemap.get(loc)
+            if tile and tile[0] in AUTOTILE_TYPES:
+                variant = AUTOTILE_TABLE[self.autotile_mask(loc, tile[0])]
+                if variant is not None and variant != tile[1]:
+                    changes.append((loc, tile, make_tile(tile[0], variant)))
+        for loc, before, tile in changes:
+            self.tilemap[loc] = tile
+            self.mark_dirty(loc)
+        self.autotile_dirty = set()
+        return changes
+
+    def autotile_mask(self, loc, tile_type):
+        mask = 0
+        for shift, bit in AUTOTILE_BITS.items():
+            neighbor = self.tilemap.get((loc[0] + shift[0], loc[1] + shift[1]))
+            if neighbor and neighbor[0] == tile_type:
+                mask |= bit
+        return mask
+
+    def autotile_all(self):
+        # Working a type at a time, so a neighbor only has to be looked up in that type's set of positions
+        by_type = {tile_type: set() for tile_type in AUTOTILE_TYPES}
+        for loc, tile in self.tilemap.items():
+            if tile[0] in by_type:
+                by_type[tile[0]].add(loc)
+
+        changes = []
+        for tile_type, locs in by_type.items():
+            tiles = [make_tile(tile_type, variant) if variant is not None else None for variant in AUTOTILE_TABLE]
+            for x, y in locs:
+                tile = tiles[((x + 1, y) in locs) | ((x - 1, y) in locs) << 1
+                             | ((x, y - 1) in locs) << 2 | ((x, y + 1) in locs) << 3]
+                if tile and tile is not self.tilemap[(x, y)]:
+                    changes.append(((x, y), self.tilemap[(x, y)], tile))
+                    self.tilemap[(x, y)] = tile
+
+        self.version += 1
+        self.autotile_dirty = set()
+        self.clear_chunks()
+        self.sight_cache.clear()
+        return changes
 
     def save(self, path):
+        if path.endswith('.map'):
+            write_map(path, self.tile_size, self.background, self.tilemap, self.offgrid_tiles)
+            return
+
+        # Writing the original JSON layout, with "x;y" keys and the position stored again in each tile
+        tilemap = {}
+        for loc, tile in self.tilemap.items():
+            tilemap[str(loc[0]) + ';' + str(loc[1])] = {'type': tile[0], 'variant': tile[1], 'pos': list(loc)}
+
         f = open(path, 'w')
         json.dump({'background': self.background, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles,
-                   'tilemap': self.tilemap}, f)
+                   'tilemap': tilemap}, f)
         f.close()
 
     def load(self, path):
         try:
-            f = open(path, 'r')
-            map_data = json.load(f)
-            f.close()
-
-            self.tilemap = map_data['tilemap']
-            self.tile_size = map_data['tile_size']
-            self.offgrid_tiles = map_data['offgrid']
-            self.background = map_data['background']
+            self.set_level(read_level(path))
         except TypeError or FileNotFoundError:
             pass
 
+    def set_level(self, level):
+        # Swapping in a level from read_level, and rebuilding everything derived from the tiles
+        self.tile_size, self.background, self.tilemap, self.offgrid_tiles = level
+        self.version += 1
+        self.autotile_dirty = None
+        self.index_offgrid()
+        self.clear_chunks()
+        self.sight_cache.clear()
+
+    def snapshot(self):
+        # Tiles are shared tuples, so copying the containers is enough to keep the current state
+        return self.version, (self.tile_size, self.background, self.tilemap.copy(), self.offgrid_tiles.copy())
+
+    def restore(self, snapshot):
+        # Nothing to do (and the baked chunks stay valid) if the tiles haven't changed since the snapshot
+        version, level = snapshot
+        if version != self.version:
+            self.set_level((level[0], level[1], level[2].copy(), level[3].copy()))
+            self.version = version
+
     def solid_check(self, pos):
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size))
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        tile = self.tilemap.get((int(pos[0] // self.tile_size), int(pos[1] // self.tile_size)))
+        if tile and tile[0] in PHYSICS_TILES:
+            return tile
+
+    def clear_sight_cache(self):
+        self.sight_cache.clear()
 
     def can_see_point(self, point_a, point_b):
-        # Getting Points inbetween
-        x1, y1 = point_a
-        x2, y2 = point_b
-        distance = ((x2 - x1) ** 2 + (y2 - y1) ** 2) ** 0.5
-        total_time = distance / 15
-        ratio = 15 / distance
-        points = []
-        for t in range(int(total_time) + 1):
-            x = x1 + (x2 - x1) * ratio * t
-            y = y1 + (y2 - y1) * ratio * t
-            points.append((x, y))
-
-        # Checking for blocks
-        for point in points:
-            if self.solid_check(point):
+        # Remembering results for the rest of the frame, by the tiles the two points are in
+        key = (int(point_a[0] // self.tile_size), int(point_a[1] // self.tile_size),
+               int(point_b[0] // self.tile_size), int(point_b[1] // self.tile_size))
+        if key not in self.sight_cache:
+            self.sight_cache[key] = self.raycast(point_a, point_b)
+        return self.sight_cache[key]
+
+    def can_see_points(self, origin, points):
+        # Many targets from one origin, sharing cached rays for points in the same tile
+        return [self.can_see_point(origin, point) for point in points]
+
+    def raycast(self, point_a, point_b):
+        # Visiting every tile the segment passes through in order (grid DDA), stopping at the first solid one
+        tile_x = int(point_a[0] // self.tile_size)
+        tile_y = int(point_a[1] // self.tile_size)
+        end_x = int(point_b[0] // self.tile_size)
+        end_y = int(point_b[1] // self.tile_size)
+        dx = point_b[0] - point_a[0]
+        dy = point_b[1] - point_a[1]
+
+        # How far along the segment (0 to 1) the next x / y tile edge is, and how far apart edges are
+        step_x = 1 if dx > 0 else -1
+        step_y = 1 if dy > 0 else -1
+        if dx:
+            edge_x = (tile_x + 1) * self.tile_size if dx > 0 else tile_x * self.tile_size
+            next_x = (edge_x - point_a[0]) / dx
+            delta_x = self.tile_size / abs(dx)
+        else:
+            next_x = delta_x = math.inf
+        if dy:
+            edge_y = (tile_y + 1) * self.tile_size if dy > 0 else tile_y * self.tile_size
+            next_y = (edge_y - point_a[1]) / dy
+            delta_y = self.tile_size / abs(dy)
+        else:
+            next_y = delta_y = math.inf
+
+        for i in range(abs(end_x - tile_x) + abs(end_y - tile_y) + 1):
+            tile = self.tilemap.get((tile_x, tile_y))
+            if tile and tile[0] in PHYSICS_TILES:
                 return False
+            if next_x < next_y:
+                tile_x += step_x
+                next_x += delta_x
+            else:
+                tile_y += step_y
+                next_y += delta_y
         return True
 
     def physics_rects_around(self, pos):
         rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(
-                    pygame.Rect(tile['pos'][0] * self.tile_size, tile['pos'][1] * self.tile_size, self.tile_size,
-                                self.tile_size))
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
+        for offset in NEIGHBOR_OFFSETS:
+            tile = self.tilemap.get((tile_x + offset[0], tile_y + offset[1]))
+            if tile and tile[0] in PHYSICS_TILES:
+                rects.append(pygame.Rect((tile_x + offset[0]) * self.tile_size, (tile_y + offset[1]) * self.tile_size,
+                                         self.tile_size, self.tile_size))
         return rects
 
-    def render(self, surf, offset=(0, 0), optimize_offgrid=True, spawners=False):
-        # Background Tiles
-        for tile in self.offgrid_tiles:
-            if tile['type'] == 'spawner' and not spawners:
-                self.offgrid_tiles.remove(tile)
-                print("Removed spawner")
-            else:
-                if optimize_offgrid:
-                    if ((self.game.player.pos[0] - tile['pos'][0]) ** 2 +
-                            (self.game.player.pos[1] - tile['pos'][1]) ** 2) ** 0.5 <= 320:
-                        surf.blit(self.game.assets[tile['type']][tile['variant']],
-                                  (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
-                else:
-                    surf.blit(self.game.assets[tile['type']][tile['variant']],
-                              (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1]))
-
-        # Collision tiles (not off-screen)
-        for x in range(offset[0] // self.tile_size, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                loc = str(x) + ";" + str(y)
-                if loc in self.tilemap:
-                    tile = self.tilemap[loc]
-                    surf.blit(self.game.assets[tile['type']][tile['variant']], (
-                        tile['pos'][0] * self.tile_size - offset[0], tile['pos'][1] * self.tile_size - offset[1]))
+    def render(self, surf, offset=(0, 0), spawners=False, outline_surf=None):
+        # Background Tiles, only those bucketed near the view
+        for tile in self.offgrid_index.query_rect((offset[0] - OFFGRID_MARGIN, offset[1] - OFFGRID_MARGIN,
+                                                   surf.get_width() + OFFGRID_MARGIN,
+                                                   surf.get_height() + OFFGRID_MARGIN)):
+            if tile['type'] != 'spawners' or spawners:
+                img = self.game.assets[tile['type']][tile['variant']]
+                pos = (tile['pos'][0] - offset[0], tile['pos'][1] - offset[1])
+                surf.blit(img, pos)
+                if outline_surf is not None:
+                    blit_outline(outline_surf, img, pos)
+
+        # Collision tiles, drawn as the cached chunks that are on screen
+        for cx in range(offset[0] // CHUNK_SIZE, (offset[0] + surf.get_width()) // CHUNK_SIZE + 1):
+            for cy in range(offset[1] // CHUNK_SIZE, (offset[1] + surf.get_height()) // CHUNK_SIZE + 1):
+                chunk = self.get_chunk((cx, cy))
+                if chunk:
+                    pos = (cx * CHUNK_SIZE - offset[0], cy * CHUNK_SIZE - offset[1])
+                    surf.blit(chunk, pos)
+                    if outline_surf is not None:
+                        # Chunk outlines are baked once, alongside the chunk
+                        if (cx, cy) not in self.chunk_outlines:
+                            self.chunk_outlines[(cx, cy)] = bake_outline(chunk)
+                        outline_surf.blit(self.chunk_outlines[(cx, cy)], (pos[0] - 1, pos[1] - 1))
+
+    def drop_chunk(self, chunk_pos):
+        self.chunks.pop(chunk_pos, None)
+        self.chunk_outlines.pop(chunk_pos, None)
+
+    def clear_chunks(self):
+        self.chunks.clear()
+        self.chunk_outlines.clear()
+
+    def get_chunk(self, chunk_pos):
+        if chunk_pos in self.chunks:
+            self.chunks.move_to_end(chunk_pos)
+            return self.chunks[chunk_pos]
+
+        chunk = self.bake_chunk(chunk_pos)
+        self.chunks[chunk_pos] = chunk
+        if len(self.chunks) > MAX_CHUNKS:
+            self.drop_chunk(next(iter(self.chunks)))
+        return chunk
+
+    def bake_chunk(self, chunk_pos):
+        origin = (chunk_pos[0] * CHUNK_SIZE, chunk_pos[1] * CHUNK_SIZE)
+        chunk = None
+
+        # Including tiles just up and left of the chunk, in case their images spill into it
+        for x in range(origin[0] // self.tile_size - CHUNK_OVERDRAW, (origin[0] + CHUNK_SIZE) // self.tile_size):
+            for y in range(origin[1] // self.tile_size - CHUNK_OVERDRAW, (origin[1] + CHUNK_SIZE) // self.tile_size):
+                tile = self.tilemap.get((x, y))
+                if tile:
+                    if not chunk:
+                        chunk = pygame.Surface((CHUNK_SIZE, CHUNK_SIZE))
+                        chunk.set_colorkey((0, 0, 0))
+                    chunk.blit(self.game.assets[tile[0]][tile[1]],
+                               (x * self.tile_size - origin[0], y * self.tile_size - origin[1]))
+
+        return chunk
@@ -2,13 +2,30 @@ import os
 
 import pygame
 
+from scripts.atlas import get_atlas
+
 BASE_IMG_PATH = 'data/images/'
 
+# id of image -> (image, mirrored copy); the image is kept so its id can't be reused
+FLIP_CACHE = {}
+
 
 def load_image(path):
-    img = pygame.image.load(BASE_IMG_PATH + path).convert()
-    img.set_colorkey((0, 0, 0))
-    return img
+    # Images come out of the packed atlas, already decoded and colorkeyed
+    return get_atlas().image(path)
+
+
+def flipped(img, flip=True):
+    # Mirrored copies are made once per image, instead of every time something facing left is drawn
+    if not flip:
+        return img
+    if id(img) not in FLIP_CACHE:
+        FLIP_CACHE[id(img)] = (img, pygame.transform.flip(img, True, False))
+    return FLIP_CACHE[id(img)][1]
+
+
+def uncache(img):
+    FLIP_CACHE.pop(id(img), None)
 
 
 def load_images(path, flip=False):
@@ -49,5 +66,5 @@ class Animation:
             if self.frame >= self.img_duration * len(self.images) - 1:
                 self.done = True
 
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)]
\ No newline at end of file
+    def img(self, flip=False):
+        return flipped(self.images[int(self.frame / self.img_duration)], flip)
\ No newline at end of file